@@ -0,0 +1,222 @@
+# asyncio parent reader class, mirrors PrimaryReader on top of create_async_engine/AsyncSession
+from itertools import chain
+from typing import AsyncIterator, List, Union
+from sqlalchemy import exc, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import DeclarativeMeta
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.expression import BinaryExpression
+from sqlalchemy_example.actors.ColumnarResult import build_columnar
+from sqlalchemy_example.actors.EngineRegistry import EngineRegistry
+from sqlalchemy_example.actors.IndexManager import IndexManager
+from sqlalchemy_example.actors.KeysetCursor import Page
+from sqlalchemy_example.actors.ReaderMetrics import reader_method
+from sqlalchemy_example.actors.ReaderStatements import ReaderStatements
+
+
+class AsyncPrimaryReader(ReaderStatements):
+    # awaitable counterpart of PrimaryReader, both build their statements with ReaderStatements and nothing sync is
+    # inherited from PrimaryReader. result caching and parallel partitions are only wired into the sync readers.
+    # an AsyncSession runs one statement at a time, use one reader per concurrent task
+    async_driver: str = "postgresql+asyncpg"
+
+    def __init__(self, echo_state: bool = False, table_type: str='app_input', pool_options: dict=None):
+        self._read_connection_config(echo_state, table_type, pool_options)
+        self.DB_CONN = self.DB_CONN.set(drivername=self.async_driver)
+        self.engine: AsyncEngine = EngineRegistry.get_async_engine(
+            self.DB_CONN,
+            schema_translate_map=self.schema_translate_map,
+            echo=self.echo_state,
+            **self.pool_options
+        )
+        self.session: AsyncSession = None
+
+
+    async def create_indexes(self, tableDomainObj: DeclarativeMeta, concurrently: bool=False) -> List[str]:
+        # see PrimaryReader.create_indexes, IndexManager runs inside the async connection's greenlet through run_sync
+        async with self.engine.connect() as conn:
+            if concurrently is True and self.engine.dialect.name == "postgresql":
+                await conn.execution_options(isolation_level="AUTOCOMMIT")
+            return await conn.run_sync(IndexManager.create_indexes, tableDomainObj, concurrently=concurrently)
+
+
+    def connect(self):
+        # creating an AsyncSession does not touch the database, a pooled connection is checked out on first use
+        try:
+            session_maker = EngineRegistry.get_async_sessionmaker(self.engine)
+            self.session: AsyncSession = session_maker()
+
+        except exc.SQLAlchemyError as e:
+            print(f"{type(e)} | {str(e)}")
+
+
+    async def disconnect(self):
+        await self.session.close()
+
+
+    def construct_query_obj(self, queryObject: Union[DeclarativeMeta, List]) -> Select:
+        # select() equivalent of PrimaryReader.construct_query_obj, Select also supports filter()/order_by()/limit()
+        if type(queryObject) == DeclarativeMeta:
+            query: Select = select(queryObject)
+        else:
+            query: Select = select(*queryObject)
+        return query
+
+
+    async def _return_query(self, query: Select, stream: bool=False, yield_per: int=1000, batched: bool=False,
+                            result_format: str="orm") -> Union[List, AsyncIterator, dict]:
+        # single entity selects return domain objects, column selects return rows, as Query does
+        if result_format != "orm":
+            return await self._columnar_result(result_format, [[query]], yield_per=yield_per)
+        if stream is False:
+            result = await self.session.execute(query)
+        else:
+            result = await self.session.stream(query.execution_options(yield_per=yield_per))
+        if self._is_entity_query(query):
+            result = result.scalars()
+        if stream is False:
+            return result.all()
+        if batched is True:
+            return self._stream_batches(result, yield_per)
+        return result
+
+
+    def _column_statement(self, query: Select) -> Select:
+        # the same select with plain table columns, rows come back as tuples without ORM objects
+        return query.with_only_columns(*query.selected_columns)
+
+
+    async def _columnar_result(self, result_format: str, query_groups: List[List[Select]], yield_per: int=1000, order: str=None,
+                               order_attr=None) -> dict:
+        # see PrimaryReader._columnar_result. each statement's rows are fetched whole on the AsyncSession, then converted
+        statement = self._column_statement(query_groups[0][0])
+        group_rows = []
+        for query_group in query_groups:
+            chunk_rows = [(await self.session.execute(self._column_statement(query))).all() for query in query_group]
+            group_rows.append(self._merge_ordered(chunk_rows, order, order_attr))
+        return build_columnar(
+            result_format,
+            self._batch_stream(chain(*group_rows), yield_per),
+            [column.key for column in statement.selected_columns],
+            [column.type for column in statement.selected_columns]
+        )
+
+
+    async def _stream_batches(self, result, yield_per: int) -> AsyncIterator[List]:
+        async for partition in result.partitions(yield_per):
+            yield partition
+
+
+    @reader_method
+    async def filter_by_column(self, queryObject: Union[DeclarativeMeta, List], cond: BinaryExpression, filter_type: str="or", order: str=None, order_attr=None,
+                               stream: bool=False, yield_per: int=1000, batched: bool=False, result_format: str="orm") -> Union[List, AsyncIterator, dict]:
+        # filter by list of binary expressions against table columns
+        # stream: return an async iterator over a server-side cursor instead of loading every row at once
+        # result_format: "orm" (objects/rows), or "numpy"/"arrow" for a columnar result
+        query: Select = self.construct_query_obj(queryObject)
+        filter_obj = self.filter_type_switch(filter_type) # can only be "and" or "or"
+        if order is not None:
+            query = query.order_by(self.order_type_swtich(order, order_attr))
+        query = query.filter(filter_obj(*cond))
+        result = await self._return_query(query, stream=stream, yield_per=yield_per, batched=batched, result_format=result_format)
+        return result
+
+
+    @reader_method
+    async def filter_by_column_page(self, queryObject: Union[DeclarativeMeta, List], cond: BinaryExpression, filter_type: str="or", order: str="min",
+                                    order_attr=None, page_size: int=100, cursor: str=None) -> Page:
+        # see PrimaryReader.filter_by_column_page
+        query: Select = self.construct_query_obj(queryObject)
+        filter_obj = self.filter_type_switch(filter_type) # can only be "and" or "or"
+        return await self._keyset_page(query.filter(filter_obj(*cond)), order, order_attr, page_size, cursor)
+
+
+    async def _keyset_page(self, query: Select, order: str="min", order_attr=None, page_size: int=100, cursor: str=None) -> Page:
+        query, order_attr, tie_attr = self._keyset_page_query(query, order, order_attr, page_size, cursor)
+        # each page reads on a short lived AsyncSession, not on this reader's session
+        async with EngineRegistry.get_async_sessionmaker(self.engine)() as session:
+            result = await session.execute(query)
+            records = result.scalars().all() if self._is_entity_query(query) else result.all()
+        return self._page_from_records(records, order, order_attr, tie_attr, page_size)
+
+
+    @reader_method
+    async def aggregate(self, cond: List, filter_type: str="and", group_by: List=[], aggregates: dict={"count": "count"},
+                        grouping_sets: List[List]=None, result_format: str="orm") -> Union[List, dict]:
+        # see PrimaryReader.aggregate
+        statement = self._aggregate_statement(cond, filter_type, group_by, aggregates, grouping_sets)
+        return self._aggregate_result(statement, (await self.session.execute(statement)).all(), result_format)
+
+
+    @reader_method
+    async def get_distinct_values(self, queryObject: Union[DeclarativeMeta, List], cond: BinaryExpression, filter_type: str="or") -> List:
+        # unlike PrimaryReader this executes the query, an unevaluated select is of no use without awaiting it
+        query: Select = self.construct_query_obj(queryObject)
+        filter_obj = self.filter_type_switch(filter_type) # can only be "and" or "or"
+        result: List = await self._return_query(query.filter(filter_obj(*cond)).distinct())
+        return result
+
+
+    @reader_method
+    async def insert_row(self, queryObject: Union[DeclarativeMeta, List]):
+        self.session.add(queryObject)
+        await self.session.commit()
+        return
+
+
+    @reader_method
+    async def update_row(self, queryObject: Union[DeclarativeMeta, List], cond: BinaryExpression, update_tuple):
+        # cond: column filtering conditional statement. should always match exactly one row
+        # update_tuple: queryObject attribute to update w value to update with. example: ('column_name', 'value')
+        query: Select = self.construct_query_obj(queryObject)
+        record = (await self.session.execute(query.filter(*cond))).scalar_one()
+        col_to_update, update_value = update_tuple
+        setattr(record, col_to_update, update_value)
+        await self.session.commit()
+        return
+
+
+    async def _execute_bulk(self, statement_builder, tableDomainObj: DeclarativeMeta, rows: List, batch_size: int, index_elements: List[str]=None) -> int:
+        affected = 0
+        for batch_statements in self._bulk_batches(statement_builder, tableDomainObj, rows, batch_size, index_elements):
+            for statement, params, group in batch_statements:
+                result = await self.session.execute(statement, params)
+                affected += self._affected_rows(result, group)
+            await self.session.commit()
+        return affected
+
+
+    @reader_method
+    async def insert_rows(self, tableDomainObj: DeclarativeMeta, rows: List, batch_size: int=1000) -> int:
+        return await self._execute_bulk(self._insert_statement, tableDomainObj, rows, batch_size)
+
+
+    @reader_method
+    async def update_rows(self, tableDomainObj: DeclarativeMeta, rows: List, batch_size: int=1000) -> int:
+        return await self._execute_bulk(self._update_statement, tableDomainObj, rows, batch_size)
+
+
+    @reader_method
+    async def upsert_rows(self, tableDomainObj: DeclarativeMeta, rows: List, batch_size: int=1000, index_elements: List[str]=None) -> int:
+        return await self._execute_bulk(self._upsert_statement, tableDomainObj, rows, batch_size, index_elements)
+
+
+    @reader_method
+    async def random_sample(self, tableDomainObj: DeclarativeMeta, sample_size: int, conditions: List=[], sample_method: str="exact",
+                            seed: float=None, sample_percent: float=1.0):
+        # see PrimaryReader.random_sample
+        if sample_method == "exact" or self.engine.dialect.name != "postgresql":
+            return (await self.session.execute(self._random_sample_query(tableDomainObj, sample_size, conditions, seed))).scalars().all()
+        while True:
+            random_sample: List[tableDomainObj] = (await self.session.execute(self._random_sample_query(
+                tableDomainObj, sample_size, conditions, seed, sample_method, sample_percent
+            ))).scalars().all()
+            if len(random_sample) >= sample_size or sample_percent >= 100:
+                return random_sample
+            sample_percent = self._grow_sample_percent(sample_percent, sample_size, len(random_sample))
+
+
+    @reader_method
+    async def commit_session(self):
+        await self.session.commit()
+        return
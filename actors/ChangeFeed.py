@@ -0,0 +1,116 @@
+# watermarks and local stores for incremental change feeds read with InvInventoryReader.iter_changes/sync_changes
+import json
+import os
+import tempfile
+import threading
+from collections import namedtuple
+from typing import Dict, List
+import sqlalchemy
+from sqlalchemy import Column, DateTime, MetaData, String, Table, and_, bindparam, select
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.engine import Row
+from sqlalchemy_example.actors.KeysetCursor import decode_value, encode_value
+
+# position of the last applied change: its change timestamp and object_id, the tie-breaker between equal timestamps
+Watermark = namedtuple("Watermark", ["changed_at", "object_id"])
+# rows: changed rows in (changed_at, object_id) order, watermark: position of the last one. a row whose doctype_match
+# is False belongs to a document outside the feed's doctypes, a local copy of it has to be removed
+ChangeBatch = namedtuple("ChangeBatch", ["rows", "watermark"])
+
+
+class JsonWatermarkStore(object):
+    # feed name -> Watermark in a JSON file, for consumers that apply changes themselves.
+    # set_watermark after a batch is applied, a batch applied twice after a crash must be harmless
+    def __init__(self, path: str):
+        self.path: str = path
+        self._lock = threading.Lock()
+
+    def _read(self) -> Dict:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as watermark_file:
+            return json.load(watermark_file)
+
+    def get_watermark(self, feed_name: str) -> Watermark:
+        with self._lock:
+            stored = self._read().get(feed_name)
+        return None if stored is None else Watermark(decode_value(stored["changed_at"]), stored["object_id"])
+
+    def set_watermark(self, feed_name: str, watermark: Watermark):
+        # written to a temporary file and renamed over the old one, a crash never leaves a half written file
+        with self._lock:
+            watermarks = self._read()
+            watermarks[feed_name] = {"changed_at": encode_value(watermark.changed_at), "object_id": watermark.object_id}
+            directory = os.path.dirname(os.path.abspath(self.path))
+            with tempfile.NamedTemporaryFile("w", dir=directory, delete=False, suffix=".tmp") as temporary_file:
+                json.dump(watermarks, temporary_file, indent=2, sort_keys=True)
+            os.replace(temporary_file.name, self.path)
+        return
+
+    def apply(self, feed_name: str, rows: List[Row], watermark: Watermark):
+        # a watermark store keeps no rows, it only records progress
+        self.set_watermark(feed_name, watermark)
+        return
+
+
+class SQLiteSnapshotStore(object):
+    # local sqlite copy of a table kept current from a change feed. rows are upserted on the primary key, rows that no
+    # longer match the feed's doctypes are deleted, and the feed watermark is written in the same transaction, so the
+    # snapshot and its watermark never disagree
+    def __init__(self, path: str, source_table: Table, table_name: str=None):
+        self.engine = sqlalchemy.create_engine(f"sqlite:///{path}")
+        self.metadata = MetaData()
+        # plain column copies, the source table's schema and postgresql specific indexes do not apply locally
+        self.table = Table(
+            table_name or f"{source_table.name}_snapshot", self.metadata,
+            *[Column(column.name, column.type, primary_key=column.primary_key) for column in source_table.columns],
+            Column("changed_at", DateTime(timezone=False))
+        )
+        self.watermarks = Table(
+            "watermarks", self.metadata,
+            Column("feed_name", String, primary_key=True),
+            Column("changed_at", DateTime(timezone=False)),
+            Column("object_id", String)
+        )
+        self.metadata.create_all(self.engine)
+        self._primary_key: List[str] = [column.name for column in self.table.primary_key.columns]
+
+    def get_watermark(self, feed_name: str) -> Watermark:
+        with self.engine.connect() as conn:
+            stored = conn.execute(
+                select(self.watermarks.c.changed_at, self.watermarks.c.object_id).where(self.watermarks.c.feed_name == feed_name)
+            ).first()
+        return None if stored is None else Watermark(*stored)
+
+    def apply(self, feed_name: str, rows: List[Row], watermark: Watermark):
+        column_names = [column.name for column in self.table.columns]
+        upsert = sqlite.insert(self.table)
+        upsert = upsert.on_conflict_do_update(
+            index_elements=self._primary_key,
+            set_={name: upsert.excluded[name] for name in column_names if name not in self._primary_key}
+        )
+        delete = self.table.delete().where(and_(*[self.table.c[name] == bindparam(f"pk_{name}") for name in self._primary_key]))
+        matching = [row for row in rows if row._mapping.get("doctype_match", True)]
+        leaving = [row for row in rows if not row._mapping.get("doctype_match", True)]
+        watermark_upsert = sqlite.insert(self.watermarks).values(
+            feed_name=feed_name, changed_at=watermark.changed_at, object_id=watermark.object_id
+        )
+        watermark_upsert = watermark_upsert.on_conflict_do_update(
+            index_elements=["feed_name"],
+            set_={"changed_at": watermark_upsert.excluded.changed_at, "object_id": watermark_upsert.excluded.object_id}
+        )
+        with self.engine.begin() as conn:
+            if len(matching) > 0:
+                conn.execute(upsert, [{name: row._mapping[name] for name in column_names} for row in matching])
+            if len(leaving) > 0:
+                conn.execute(delete, [{f"pk_{name}": row._mapping[name] for name in self._primary_key} for row in leaving])
+            conn.execute(watermark_upsert)
+        return
+
+    def count(self) -> int:
+        with self.engine.connect() as conn:
+            return conn.execute(select(sqlalchemy.func.count()).select_from(self.table)).scalar()
+
+    def close(self):
+        self.engine.dispose()
+        return
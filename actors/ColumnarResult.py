@@ -0,0 +1,73 @@
+# builds columnar results (dict of numpy arrays or a pyarrow Table) from batches of result rows
+import datetime
+from typing import Dict, Iterable, List
+from sqlalchemy.types import TypeEngine
+
+
+def _python_type(sql_type: TypeEngine):
+    try:
+        return sql_type.python_type
+    except NotImplementedError:
+        return object
+
+
+def _require(module_name: str, result_format: str):
+    # numpy and pyarrow are optional, only needed when a columnar result_format is requested
+    try:
+        return __import__(module_name)
+    except ImportError as e:
+        raise ImportError(f"result_format='{result_format}' requires the '{module_name}' package") from e
+
+
+def numpy_dtype_switch(python_type) -> str:
+    # integers are read as float64 so NULLs can become NaN, datetimes become datetime64 with NULL as NaT
+    return {
+        datetime.datetime: "datetime64[us]",
+        datetime.date: "datetime64[D]",
+        float: "float64",
+        int: "float64",
+    }.get(python_type, "object")
+
+
+def arrow_type_switch(pa, python_type):
+    return {
+        datetime.datetime: pa.timestamp("us"),
+        datetime.date: pa.date32(),
+        float: pa.float64(),
+        int: pa.int64(),
+        str: pa.string(),
+        bool: pa.bool_(),
+    }.get(python_type)
+
+
+def to_numpy(batches: Iterable[List], keys: List[str], sql_types: List[TypeEngine]) -> Dict:
+    np = _require("numpy", "numpy")
+    dtypes = [numpy_dtype_switch(_python_type(sql_type)) for sql_type in sql_types]
+    column_chunks = {key: [] for key in keys}
+    for batch in batches:
+        # transpose each cursor batch into one array per column, rows are released as soon as the batch is converted
+        for key, dtype, values in zip(keys, dtypes, zip(*batch)):
+            column_chunks[key].append(np.array(values, dtype=dtype))
+    return {
+        key: np.concatenate(chunks) if len(chunks) > 0 else np.array([], dtype=dtype)
+        for (key, chunks), dtype in zip(column_chunks.items(), dtypes)
+    }
+
+
+def to_arrow(batches: Iterable[List], keys: List[str], sql_types: List[TypeEngine]):
+    pa = _require("pyarrow", "arrow")
+    schema = pa.schema([
+        (key, arrow_type_switch(pa, _python_type(sql_type)) or pa.string())
+        for key, sql_type in zip(keys, sql_types)
+    ])
+    record_batches = [
+        pa.record_batch([pa.array(values, type=field.type) for field, values in zip(schema, zip(*batch))], schema=schema)
+        for batch in batches
+        if len(batch) > 0
+    ]
+    return pa.Table.from_batches(record_batches, schema=schema)
+
+
+def build_columnar(result_format: str, batches: Iterable[List], keys: List[str], sql_types: List[TypeEngine]):
+    # result_format: "numpy" for {column: ndarray}, "arrow" for a pyarrow.Table
+    return {"numpy": to_numpy, "arrow": to_arrow}[result_format](batches, keys, sql_types)
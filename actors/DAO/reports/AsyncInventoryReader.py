@@ -0,0 +1,169 @@
+from datetime import datetime, timedelta
+from itertools import chain
+from typing import AsyncIterator, List, Union
+from sqlalchemy_example.domain.reports.Inventory import Inv
+from sqlalchemy_example.actors.AsyncPrimaryReader import AsyncPrimaryReader
+from sqlalchemy_example.actors.ChangeFeed import ChangeBatch, Watermark
+from sqlalchemy_example.actors.DAO.reports.InventoryStatements import InvInventoryStatements
+from sqlalchemy_example.actors.EngineRegistry import EngineRegistry
+from sqlalchemy_example.actors.KeysetCursor import Page
+from sqlalchemy_example.actors.ReaderMetrics import reader_method
+
+from sqlalchemy.orm import DeclarativeMeta
+
+
+class AsyncInvInventoryReader(InvInventoryStatements, AsyncPrimaryReader):
+    # doctype conditions and statement builders come from InvInventoryStatements, execution from AsyncPrimaryReader.
+    # run lookups concurrently with one reader (and so one AsyncSession) per task, e.g. asyncio.gather over readers
+
+    def __init__(self, echo_state: bool = False, pool_options: dict=None):
+        AsyncPrimaryReader.__init__(self, echo_state=echo_state, pool_options=pool_options)
+
+    @reader_method
+    async def get_folder_ids(self, cond: List, docType: str, return_query: bool=False, distinct: bool=False) -> List:
+        tmp_cond_list, filter_type = self._folder_id_conditions(cond, docType)
+        if distinct is True:
+            query: List = await self.get_distinct_values([Inv.folder_id], tmp_cond_list, filter_type=filter_type)
+            return self._folder_ids_from_distinct_records(query, return_query)
+        target_columns = [Inv.creation_date, Inv.folder_id]
+        query: List = await self.filter_by_column(target_columns, tmp_cond_list, filter_type=filter_type)
+        return self._folder_ids_from_records(query, return_query)
+
+    @reader_method
+    async def query_creationdate_range(self, date_range: List, docType: list=["K"], columns: List=None, result_format: str="orm") -> Union[List, dict]:
+        condition_list = self._creationdate_range_conditions(date_range, docType)
+        query: List[Inv] = await self.filter_by_column(columns or Inv, condition_list, filter_type="and", result_format=result_format)
+        return query
+
+    @reader_method
+    async def query_creationdate_exact(self, searchDate: str, docType: list=["K"], stream: bool=False, yield_per: int=1000, batched: bool=False,
+                                       columns: List=None, result_format: str="orm") -> Union[List, AsyncIterator, dict]:
+        condition_list = self._creationdate_exact_conditions(searchDate, docType)
+        query = await self.filter_by_column(
+            columns or Inv, condition_list, filter_type="and", stream=stream, yield_per=yield_per, batched=batched, result_format=result_format
+        )
+        return query
+
+    @reader_method
+    async def query_r_object_id(self, object_id: List, docType: list=["K"], columns: List=None, result_format: str="orm") -> Union[List, dict]:
+        docType_statement = self._get_condlist_by_doctype(docType, include_and_statement=True)
+        condition_list = [docType_statement, Inv.object_id.in_(object_id)]
+        query: List[Inv] = await self.filter_by_column(columns or Inv, condition_list, filter_type="and", result_format=result_format)
+        return query
+
+    @reader_method
+    async def query_submission_id(self, submission_id: List, docType: list=["K"], order=None, order_attr=None, columns: List=None,
+                                  result_format: str="orm") -> Union[List, dict]:
+        # chunks run one after another on this reader's session, use several readers to spread ids over connections
+        query_groups = self._submission_id_query_groups(submission_id, docType, order, order_attr, columns)
+        if result_format != "orm":
+            return await self._columnar_result(result_format, query_groups, order=order, order_attr=order_attr)
+        if len(query_groups) == 1:
+            query: List[Inv] = await self._return_query(query_groups[0][0])
+            return query
+        group_results = []
+        for query_group in query_groups:
+            chunk_results = [await self._return_query(chunk_query) for chunk_query in query_group]
+            group_results.append(self._merge_ordered(chunk_results, order, order_attr))
+        return list(chain(*group_results))
+
+    @reader_method
+    async def query_creationdate_range_page(self, date_range: List, docType: list=["K"], order: str="min", order_attr=Inv.creation_date,
+                                            page_size: int=100, cursor: str=None, columns: List=None) -> Page:
+        condition_list = self._creationdate_range_conditions(date_range, docType)
+        return await self.filter_by_column_page(
+            columns or Inv, condition_list, filter_type="and", order=order, order_attr=order_attr, page_size=page_size, cursor=cursor
+        )
+
+    @reader_method
+    async def query_creationdate_exact_page(self, searchDate, docType: list=["K"], order: str="min", order_attr=Inv.object_id,
+                                            page_size: int=100, cursor: str=None, columns: List=None) -> Page:
+        condition_list = self._creationdate_exact_conditions(searchDate, docType)
+        return await self.filter_by_column_page(
+            columns or Inv, condition_list, filter_type="and", order=order, order_attr=order_attr, page_size=page_size, cursor=cursor
+        )
+
+    @reader_method
+    async def query_submission_id_page(self, submission_id: List, docType: list=["K"], order: str="min", order_attr=Inv.creation_date,
+                                       page_size: int=100, cursor: str=None, columns: List=None) -> Page:
+        folder_ids, supplement_ids = self._split_submission_ids(submission_id)
+        part_statements = self._submission_id_parts(folder_ids, supplement_ids, self._doctype_statement(docType))
+        return await self.filter_by_column_page(
+            columns or Inv, part_statements, filter_type="or", order=order, order_attr=order_attr, page_size=page_size, cursor=cursor
+        )
+
+    @reader_method
+    async def query_unique_column_values(self, columnObjectList: Union[DeclarativeMeta, List], docType: list=["K"]) -> List:
+        docType_statement = self._get_condlist_by_doctype(docType, include_and_statement=True)
+        query: List = await self.get_distinct_values(columnObjectList, [docType_statement], filter_type="and")
+        return query
+
+    @reader_method
+    async def random_kdoc_sample(self, sample_size: int, sample_method: str="exact", seed: float=None) -> List:
+        return await self.random_sample(Inv, sample_size, self.kfile_conditions_list, sample_method=sample_method, seed=seed)
+
+    @reader_method
+    async def random_pma_sample(self, sample_size: int, sample_method: str="exact", seed: float=None) -> List:
+        return await self.random_sample(Inv, sample_size, self.pdoc_conditions_list, sample_method=sample_method, seed=seed)
+
+    @reader_method
+    async def random_nonkdoc_sample(self, sample_size: int, sample_method: str="exact", seed: float=None) -> List:
+        return await self.random_sample(Inv, sample_size, self.nonkfile_conditions_list, sample_method=sample_method, seed=seed)
+
+    @reader_method
+    async def aggregate_inventory(self, group_by: List=[], aggregates: dict={"documents": "count"}, docType: list=["all"], conditions: List=None,
+                                  grouping_sets: List[List]=None, result_format: str="orm") -> Union[List, dict]:
+        # see InvInventoryReader.aggregate_inventory
+        condition_list, group_by, grouping_sets = self._aggregate_inventory_args(group_by, docType, conditions, grouping_sets)
+        return await self.aggregate(
+            condition_list, filter_type="and", group_by=group_by, aggregates=aggregates, grouping_sets=grouping_sets, result_format=result_format
+        )
+
+    @reader_method
+    async def get_max_r_creation_date_by_subid(self, subids: list) -> List:
+        result = await self.aggregate_inventory(
+            [Inv.folder_id], {"max_creation_date": ("max", Inv.creation_date)}, docType=["all"], conditions=[Inv.folder_id.in_(subids)]
+        )
+        await self.session.commit()
+        return result
+
+    @reader_method
+    async def iter_changes(self, docType: list=["all"], since: Watermark=None, batch_size: int=1000, conditions: List=None,
+                           lookback: timedelta=None) -> AsyncIterator[ChangeBatch]:
+        # see InvInventoryReader.iter_changes, returns an async iterator: async for batch in await reader.iter_changes()
+        return self._change_batches(docType, since, batch_size, conditions, lookback)
+
+    async def _change_batches(self, docType: list, since: Watermark, batch_size: int, conditions: List,
+                              lookback: timedelta) -> AsyncIterator[ChangeBatch]:
+        # each batch is read on a short lived AsyncSession, no transaction stays open between batches
+        session_maker = EngineRegistry.get_async_sessionmaker(self.engine)
+        statement = self._changes_statement(docType, conditions, since, batch_size, lookback)
+        while True:
+            async with session_maker() as session:
+                rows = (await session.execute(statement)).all()
+            if len(rows) == 0:
+                return
+            watermark = Watermark(rows[-1].changed_at, rows[-1].object_id)
+            yield ChangeBatch(rows, watermark)
+            if len(rows) < batch_size:
+                return
+            statement = self._changes_statement(docType, conditions, watermark, batch_size)
+
+    @reader_method
+    async def sync_changes(self, store, feed_name: str=None, docType: list=["all"], batch_size: int=1000, conditions: List=None,
+                           lookback: timedelta=None) -> int:
+        # see InvInventoryReader.sync_changes. store methods are synchronous, SQLiteSnapshotStore and JsonWatermarkStore
+        # block the event loop while they write a batch
+        feed_name = self._feed_name(feed_name, docType)
+        applied = 0
+        async for batch in await self.iter_changes(docType, store.get_watermark(feed_name), batch_size, conditions, lookback):
+            store.apply(feed_name, batch.rows, batch.watermark)
+            applied += len(batch.rows)
+        return applied
+
+    @reader_method
+    async def get_change_sups(self, subids: list, since: datetime=datetime(2025, 1, 1)) -> List:
+        query = (await self.session.execute(self._change_sups_statement(subids, since))).all()
+        await self.session.commit()
+        pma_change_sups = [record[0] for record in query]
+        return pma_change_sups
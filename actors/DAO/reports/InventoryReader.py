@@ -1,238 +1,239 @@
-from typing import List, Union
+from datetime import datetime, timedelta
+from itertools import chain
+from typing import Iterator, List, Union
 from sqlalchemy_example.domain.reports.Inventory import Inv
 from sqlalchemy_example.actors.PrimaryReader import PrimaryReader
+from sqlalchemy_example.actors.ChangeFeed import ChangeBatch, Watermark
+from sqlalchemy_example.actors.DAO.reports.InventoryStatements import InvInventoryStatements
+from sqlalchemy_example.actors.EngineRegistry import EngineRegistry
+from sqlalchemy_example.actors.KeysetCursor import Page
+from sqlalchemy_example.actors.ReaderMetrics import reader_method
+from sqlalchemy_example.actors.ResultCache import ResultCache
 
-import sqlalchemy
-from sqlalchemy import exc
 from sqlalchemy import or_, and_
-from sqlalchemy.engine import Engine
-from sqlalchemy.orm import Session, DeclarativeMeta, Query
-from sqlalchemy.sql.expression import BinaryExpression
-from sqlalchemy import select, func
-
-
-class InvInventoryReader(PrimaryReader):
-
-    def __init__(self):
-        self.supported_doctypes = ["K", "P"]
-        self.pdoc_conditions_list = [
-            Inv.folder_id.regexp_match('P[0-9]{6,9}'),
-            Inv.object_id.regexp_match('.*?(.pdf|.doc)'),
-            func.lower(Inv.validation_status)=='validated',
-            func.upper(Inv.uniquekey).contains("RESPONSE")==False,
-            func.upper(Inv.sub_type).contains('RESPONSE')==False,
-            Inv.doc_download_date.isnot(None)
-            ]
-        self.kfile_conditions_list = [
-            Inv.folder_id.startswith("K"),
-            Inv.object_id.endswith(".pdf"),
-            func.lower(Inv.doc_download_status)=='downloaded',
-            func.lower(Inv.doc_validation_status)=='validated',
-            or_(func.upper(Inv.uniquekey).startswith("/SUPPLEMENT")==False, Inv.uniquekey.is_(None)),
-            or_(func.upper(Inv.uniquekey).startswith("/AMENDMENT")==False, Inv.uniquekey.is_(None)),
-            or_(func.upper(Inv.sub_type).contains('CORRESPONDENCE')==False, Inv.uniquekey.is_(None)),
-            Inv.doc_download_date.isnot(None)
-            ]
-        self.nonkfile_conditions_list = [
-            Inv.folder_id.startswith("K")==False,
-            Inv.object_id.endswith(".pdf"),
-            func.lower(Inv.doc_download_status)=='downloaded',
-            func.lower(Inv.doc_validation_status)=='validated'
-        ]
-
-        super(InvInventoryReader, self).__init__()
-
-    def _doctype_assessment(self, docType):
-        if len(docType)==1: # if the docType list has only one doctype
-            if docType[0] == "all":
-                return 1, self.supported_doctypes
-            else:
-                return 0, docType[0] # return the single string
-        else:
-            return 1, docType # return the list
-
-    def _condlist_switch(self, docType) -> List:
-        switch = {
-            "K": self.kfile_conditions_list.copy(),
-            "P": self.pdoc_conditions_list.copy()
-        }
-        return switch[docType]
-
-    def _format_supplement_ids(self, unformatted_supplement_ids):
-        formatted_supp_ids = [tuple(supp_id.split("/", 1)) for supp_id in unformatted_supplement_ids]
-        return formatted_supp_ids
-
-    def _identify_submission_types(self, subids_to_query):
-        all_submission_types = [subid[0] for subid in subids_to_query]
-        submission_types = list(set(all_submission_types))
-        return submission_types
-
-    def _generate_doctype_and_statement(self, docType, include_and_statement, additional_conditions=None):
-        doctype_condlist = self._condlist_switch(docType)
-        if additional_conditions is not None:
-            doctype_condlist.extend(additional_conditions)
-        to_return = {True: and_(*doctype_condlist).self_group(), False: doctype_condlist}
-        return to_return[include_and_statement]
-
-    def _get_condlist_by_doctype(self, docType, include_and_statement: bool, additional_conditions=None) -> List:
-        condlist_flag, docType = self._doctype_assessment(docType)
-        if condlist_flag==0: # if only one doctype, return that doctypes condition list in an and_()
-            doctype_and_statement = self._generate_doctype_and_statement(
-                docType,
-                include_and_statement=include_and_statement,
-                additional_conditions=additional_conditions
-            )
-            return doctype_and_statement
-        else: # if 1<doctype, return or_ in dynamically constructed condition lists based on submission types present
-            and_statements = []
-            for submission_type in docType:
-                doctype_and_statement = self._generate_doctype_and_statement(
-                    submission_type,
-                    include_and_statement=include_and_statement,
-                    additional_conditions=additional_conditions
-                )
-                and_statements.append(doctype_and_statement)
-            return and_statements
-
-    def get_folder_ids(self, cond: List, docType: str, return_query: bool=False) -> List:
+from sqlalchemy.orm import DeclarativeMeta, Query
+
+
+class InvInventoryReader(InvInventoryStatements, PrimaryReader):
+    def __init__(self, echo_state: bool = False, pool_options: dict=None, result_cache: ResultCache=None, parallel_workers: int=None):
+        super(InvInventoryReader, self).__init__(
+            echo_state=echo_state, pool_options=pool_options, result_cache=result_cache, parallel_workers=parallel_workers
+        )
+
+    def _parallel_folder_ids(self, doctype_statements: List, return_query: bool=False, distinct: bool=False):
+        # one partition per doctype, each excludes rows an earlier doctype already matched so rows are not repeated
+        target_columns = [Inv.folder_id] if distinct is True else [Inv.creation_date, Inv.folder_id]
+        partition_queries = []
+        for number, doctype_statement in enumerate(doctype_statements):
+            conditions = [doctype_statement]
+            if number > 0:
+                conditions.append(or_(*doctype_statements[:number]).is_not(True))
+            query = self.construct_query_obj(target_columns).filter(and_(*conditions))
+            partition_queries.append([query.distinct() if distinct is True else query])
+        query: List = self._parallel_result(partition_queries)
+        if distinct is False:
+            return self._folder_ids_from_records(query, return_query)
+        query = list(dict.fromkeys(query)) # a folder with documents of several doctypes is found by several partitions
+        return self._folder_ids_from_distinct_records(query, return_query)
+
+    @reader_method
+    def get_folder_ids(self, cond: List, docType: str, return_query: bool=False, distinct: bool=False) -> List:
         # get list of folder_ids for a given series of conditions to query against for related docs
+        # distinct: de-duplicate on the server and fetch folder_id only, return_query then returns the (folder_id,) rows
+        tmp_cond_list, filter_type = self._folder_id_conditions(cond, docType)
+        if self.parallel_workers and filter_type == "or":
+            return self._parallel_folder_ids(tmp_cond_list, return_query, distinct)
+        if distinct is True:
+            query: List = self._cached_all(self.get_distinct_values([Inv.folder_id], tmp_cond_list, filter_type=filter_type))
+            return self._folder_ids_from_distinct_records(query, return_query)
         target_columns = [Inv.creation_date, Inv.folder_id]
-        condlist_flag, docType = self._doctype_assessment(docType)
-        if condlist_flag==0:
-            tmp_cond_list = self._get_condlist_by_doctype(
-                docType,
-                include_and_statement=False,
-                additional_conditions=cond
-            )
-            query: List[Inv] = self.filter_by_column(target_columns, tmp_cond_list, filter_type="and")
-        else:
-            tmp_cond_list = self._get_condlist_by_doctype(
-                docType,
-                include_and_statement=True,
-                additional_conditions=cond
-            )
-            query: List[Inv] = self.filter_by_column(target_columns, tmp_cond_list, filter_type="or")
-        if len(query) > 0:
-            if return_query is False:
-                folder_ids = list(set([record[1] for record in query]))
-                return folder_ids
-            if return_query is True:
-                folder_ids = list(set([record[1] for record in query]))
-                return folder_ids, query
-
-    def query_creationdate_range(self,  date_range: List, docType: list=["K"]) -> List:
-        # returns all folder_ids of a given range, then use those ids to return all related docs
+        query: List[Inv] = self.filter_by_column(target_columns, tmp_cond_list, filter_type=filter_type, use_cache=True)
+        return self._folder_ids_from_records(query, return_query)
+
+    @reader_method
+    def query_creationdate_range(self,  date_range: List, docType: list=["K"], stream: bool=False, yield_per: int=1000, batched: bool=False,
+                                 columns: List=None, result_format: str="orm") -> Union[List, Iterator, dict]:
         # returns ALL docs for a folderid if that id appears in daterange search.
+        # runs as one statement: docs of the doctype whose folder_id is IN the folder ids matched in the date range
         # this logic does not yet apply to the other methods fo this class
         startDate, endDate = date_range
-        daterange_conditions: List[BinaryExpression] = [
-            startDate <= Inv.r_creation_date,
-            Inv.r_creation_date <= endDate
-        ] # create list with date range conditions
-        folder_ids: List[str] = self.get_folder_ids(daterange_conditions, docType) # get folder ids for given date range
-        query: List[Inv] = self.query_submission_id(folder_ids, docType)
+        condition_list = self._creationdate_range_conditions(date_range, docType)
+        if self.parallel_workers and stream is False:
+            # partitions split the returned documents on their own creation_date, so no document is read twice
+            partition_queries = [
+                [self.construct_query_obj(columns or Inv).filter(and_(*condition_list, partition_condition))]
+                for partition_condition in self._range_partitions(Inv.creation_date, startDate, endDate, self.parallel_workers)
+            ]
+            return self._parallel_result(partition_queries, result_format=result_format, yield_per=yield_per)
+        query: List[Inv] = self.filter_by_column(
+            columns or Inv, condition_list, filter_type="and", stream=stream, yield_per=yield_per, batched=batched, result_format=result_format
+        )
         return query
 
-    def query_creationdate_exact(self, searchDate: str, docType: list=["K"]) -> List:
-        doctype_statement = self._get_condlist_by_doctype(docType, include_and_statement=True)
-        date_statement = [searchDate == Inv.creation_date]
-        condition_list = [doctype_statement, date_statement]
-        query: List[Inv] = self.filter_by_column(Inv, condition_list, filter_type="and")
+    @reader_method
+    def query_creationdate_range_page(self, date_range: List, docType: list=["K"], order: str="min", order_attr=Inv.creation_date,
+                                      page_size: int=100, cursor: str=None, columns: List=None) -> Page:
+        # one page of query_creationdate_range in (order_attr, object_id) order, pass page.next_cursor to get the next one
+        condition_list = self._creationdate_range_conditions(date_range, docType)
+        return self.filter_by_column_page(
+            columns or Inv, condition_list, filter_type="and", order=order, order_attr=order_attr, page_size=page_size, cursor=cursor
+        )
+
+    @reader_method
+    def query_creationdate_exact(self, searchDate: str, docType: list=["K"], stream: bool=False, yield_per: int=1000, batched: bool=False,
+                                 columns: List=None, result_format: str="orm") -> Union[List, Iterator, dict]:
+        condition_list = self._creationdate_exact_conditions(searchDate, docType)
+        query: List[Inv] = self.filter_by_column(
+            columns or Inv, condition_list, filter_type="and", stream=stream, yield_per=yield_per, batched=batched, result_format=result_format
+        )
         return query
 
-    def query_r_object_id(self, object_id: List, docType: list=["K"]) -> List:
+    @reader_method
+    def query_creationdate_exact_page(self, searchDate, docType: list=["K"], order: str="min", order_attr=Inv.object_id,
+                                      page_size: int=100, cursor: str=None, columns: List=None) -> Page:
+        condition_list = self._creationdate_exact_conditions(searchDate, docType)
+        return self.filter_by_column_page(
+            columns or Inv, condition_list, filter_type="and", order=order, order_attr=order_attr, page_size=page_size, cursor=cursor
+        )
+
+    @reader_method
+    def query_r_object_id(self, object_id: List, docType: list=["K"], columns: List=None, result_format: str="orm") -> Union[List, dict]:
         # query for singular document of a specific object_id
         docType_statement = self._get_condlist_by_doctype(docType, include_and_statement=True)
-        objectid_statement = or_(*[Inv.object_id==oid for oid in object_id])
+        objectid_statement = Inv.object_id.in_(object_id) # one expanding parameter, cached regardless of list length
         condition_list = [docType_statement, objectid_statement]
-        query: List[Inv] = self.filter_by_column(Inv, condition_list, filter_type="and")
+        query: List[Inv] = self.filter_by_column(columns or Inv, condition_list, filter_type="and", result_format=result_format)
         return query
 
-    def query_submission_id(self, submission_id: List, docType: list=["K"], order=None, order_attr=None) -> List:
-        docType_statement = self._get_condlist_by_doctype(docType, include_and_statement=True)
-        submission_types = self._identify_submission_types(submission_id)
-        folderid_statement = or_(*[Inv.folder_id==subid for subid in submission_id if "/" not in subid])
-        if len(submission_types)>1:
-            condition_list = [or_(*docType_statement), folderid_statement]
-        else:
-            condition_list = [docType_statement, folderid_statement]
-
-        if any("/" in subid for subid in submission_id):
-            supplement_ids = [subid for subid in submission_id if "/" in subid]
-            other_ids = [subid for subid in submission_id if "/" not in subid]
-            formatted_supplement_ids = self._format_supplement_ids(supplement_ids) # returns list of tuples
-            supplement_conditions = [
-                and_(Inv.folder_id==subid, Inv.uniquekey==f"/{supp}") for subid, supp in formatted_supplement_ids
-            ]
+    @reader_method
+    def query_submission_id(self, submission_id: List, docType: list=["K"], order=None, order_attr=None,
+                            stream: bool=False, yield_per: int=1000, batched: bool=False,
+                            columns: List=None, result_format: str="orm") -> Union[List, Iterator, dict]:
+        # stream: yield rows (or lists of yield_per rows when batched) from server-side cursors instead of a list
+        # columns: load only these Inv columns as rows instead of full Inv objects, must include order_attr when ordering
+        # result_format: "numpy" or "arrow" returns columnar data built from cursor batches
+        # id lists longer than id_chunk_size are split into several statements and merged back in order
+        if self.parallel_workers and stream is False:
+            # chunks are sized from the distinct ids to keep every worker busy
+            submission_id = list(dict.fromkeys(submission_id))
+            chunk_size = min(self.id_chunk_size, max(1, -(-len(submission_id) // self.parallel_workers)))
+            query_groups = self._submission_id_query_groups(submission_id, docType, order, order_attr, columns, chunk_size=chunk_size)
+            return self._parallel_result(query_groups, order, order_attr, result_format=result_format, yield_per=yield_per)
+        query_groups = self._submission_id_query_groups(submission_id, docType, order, order_attr, columns)
+        if result_format != "orm":
+            return self._columnar_result(result_format, query_groups, yield_per=yield_per, order=order, order_attr=order_attr)
+        if len(query_groups) == 1:
+            return self._return_query(query_groups[0][0], stream=stream, yield_per=yield_per, batched=batched)
+
+        query = chain(*[
+            self._merge_ordered(
+                [self._return_query(chunk_query, stream=stream, yield_per=yield_per) for chunk_query in query_group],
+                order,
+                order_attr
+            ) for query_group in query_groups
+        ])
+        if stream is False:
+            return list(query)
+        if batched is True:
+            return self._batch_stream(query, yield_per)
+        return query
 
-            if len(other_ids)>0:
-                submission_query: List[Inv] = self.filter_by_column(
-                    Inv,
-                    condition_list,
-                    filter_type="and",
-                    order=order,
-                    order_attr=order_attr
-                )
-            else:
-                submission_query = list()
-            supplement_query: List[Inv] = self.filter_by_column(
-                Inv,
-                supplement_conditions,
-                filter_type="or",
-                order=order,
-                order_attr=order_attr
-            )
-            supplement_query_final = [o for o in supplement_query if o.object_id.endswith(".pdf")]
-            query = submission_query + supplement_query_final
-            return query
-        else:
-            query: List[Inv] = self.filter_by_column(
-                Inv,
-                condition_list,
-                filter_type="and",
-                order=order,
-                order_attr=order_attr
-            )
-            return query
-
-    def query_unique_column_values(self, columnObjectList: Union[DeclarativeMeta, List], docType: list=["K"]) -> List:
+    @reader_method
+    def query_submission_id_page(self, submission_id: List, docType: list=["K"], order: str="min", order_attr=Inv.creation_date,
+                                 page_size: int=100, cursor: str=None, columns: List=None) -> Page:
+        # one page of query_submission_id. pages follow (order_attr, object_id) across submission and supplement
+        # documents alike, rather than listing submission documents first, and the id list is one statement whatever its length
+        folder_ids, supplement_ids = self._split_submission_ids(submission_id)
+        part_statements = self._submission_id_parts(folder_ids, supplement_ids, self._doctype_statement(docType))
+        return self.filter_by_column_page(
+            columns or Inv, part_statements, filter_type="or", order=order, order_attr=order_attr, page_size=page_size, cursor=cursor
+        )
+
+    @reader_method
+    def query_unique_column_values(self, columnObjectList: Union[DeclarativeMeta, List], docType: list=["K"], use_cache: bool=False) -> Union[Query, List]:
         # get count of unique values in a given column
-        docType_statement = self._get_condlist_by_doctype(docType)
+        # returns the unevaluated distinct query, or with use_cache its rows, served from the result cache when there is one
+        docType_statement = self._get_condlist_by_doctype(docType, include_and_statement=True)
         condition_list = [docType_statement]
-        query: List[Inv] = self.get_distinct_values(columnObjectList, condition_list, filter_type="and")
+        query: Query = self.get_distinct_values(columnObjectList, condition_list, filter_type="and")
+        if use_cache is True:
+            return self._cached_all(query)
         return query
 
-    def random_kdoc_sample(self, sample_size: int) -> List:
-        query: List[Inv] = self.random_sample(Inv, sample_size, self.kfile_conditions_list)
+    @reader_method
+    def random_kdoc_sample(self, sample_size: int, sample_method: str="exact", seed: float=None) -> List:
+        query: List[Inv] = self.random_sample(Inv, sample_size, self.kfile_conditions_list, sample_method=sample_method, seed=seed)
         return query
 
-    def random_pma_sample(self, sample_size: int) -> List:
-        query: List[Inv] = self.random_sample(Inv, sample_size, self.pdoc_conditions_list)
+    @reader_method
+    def random_pma_sample(self, sample_size: int, sample_method: str="exact", seed: float=None) -> List:
+        query: List[Inv] = self.random_sample(Inv, sample_size, self.pdoc_conditions_list, sample_method=sample_method, seed=seed)
         return query
 
-    def random_nonkdoc_sample(self, sample_size: int) -> List:
-        query: List[Inv] = self.random_sample(Inv, sample_size, self.nonkfile_conditions_list)
+    @reader_method
+    def random_nonkdoc_sample(self, sample_size: int, sample_method: str="exact", seed: float=None) -> List:
+        query: List[Inv] = self.random_sample(Inv, sample_size, self.nonkfile_conditions_list, sample_method=sample_method, seed=seed)
         return query
-    
+
+    @reader_method
+    def aggregate_inventory(self, group_by: List=[], aggregates: dict={"documents": "count"}, docType: list=["all"], conditions: List=None,
+                            grouping_sets: List[List]=None, result_format: str="orm") -> Union[List, dict]:
+        # counts and totals over the documents of docType (plus any extra conditions) computed by the database, e.g.
+        #   aggregate_inventory(["doctype"], {"documents": "count", "pages": ("sum", Inv.number_of_pages),
+        #                                     "bytes": ("sum", Inv.full_content_size), "folders": ("count_distinct", Inv.folder_id)})
+        #   aggregate_inventory(["doctype", Inv.doc_download_status, Inv.doc_validation_status], {"documents": "count"},
+        #                       grouping_sets=[["doctype", "doc_download_status"], ["doctype", "doc_validation_status"], []])
+        condition_list, group_by, grouping_sets = self._aggregate_inventory_args(group_by, docType, conditions, grouping_sets)
+        return self.aggregate(
+            condition_list, filter_type="and", group_by=group_by, aggregates=aggregates, grouping_sets=grouping_sets, result_format=result_format
+        )
+
+    @reader_method
     def get_max_r_creation_date_by_subid(self, subids: list) -> List:
-        condition_lists = self._get_condlist_by_doctype(docType=["all"], include_and_statement=True)
-        result = self.session.execute(select(Inv.folder_id, func.max(Inv.creation_date))
-                                      .where(Inv.folder_id.in_(subids))
-                                      .where(or_(*condition_lists))
-                                      .group_by(Inv.folder_id)).all()
+        # (folder_id, max_creation_date) per folder among the K and P documents of subids
+        result = self.aggregate_inventory(
+            [Inv.folder_id], {"max_creation_date": ("max", Inv.creation_date)}, docType=["all"], conditions=[Inv.folder_id.in_(subids)]
+        )
         self.session.commit()
         return result
 
-    def get_change_sups(self, subids: list) -> List:
-        condition_list = self._get_condlist_by_doctype(docType=['P'],include_and_statement=True)
-        query = self.session.execute(select(func.distinct(Inv.folder_id + Inv.uniquekey))
-                                    .where(condition_list,
-                                            Inv.folder_id.in_(subids),
-                                            func.lower(Inv.uniquekey).contains('supplement'),
-                                            func.length(Inv.uniquekey) > 1,
-                                            Inv.uniquekey.is_not(None),
-                                            Inv.creation_date >= '2025-01-01'
-                                            )).all()
+    @reader_method
+    def iter_changes(self, docType: list=["all"], since: Watermark=None, batch_size: int=1000, conditions: List=None,
+                     lookback: timedelta=None) -> Iterator[ChangeBatch]:
+        # yields ChangeBatch(rows, watermark) for every document inserted or changed after since, oldest first.
+        # since: watermark of the last applied change, None reads everything. rows carry changed_at, every Inv column and
+        # doctype_match, False for documents that do not (or no longer) match docType and should be dropped by the consumer
+        # lookback: also re-read changes up to this long before since, applying them again must be harmless
+        # each batch is read on a short lived session, no transaction stays open between batches
+        session_maker = EngineRegistry.get_sessionmaker(self.engine)
+        statement = self._changes_statement(docType, conditions, since, batch_size, lookback)
+        while True:
+            with session_maker() as session:
+                rows = session.execute(statement).all()
+            if len(rows) == 0:
+                return
+            watermark = Watermark(rows[-1].changed_at, rows[-1].object_id)
+            yield ChangeBatch(rows, watermark)
+            if len(rows) < batch_size:
+                return
+            statement = self._changes_statement(docType, conditions, watermark, batch_size)
+
+    @reader_method
+    def sync_changes(self, store, feed_name: str=None, docType: list=["all"], batch_size: int=1000, conditions: List=None,
+                     lookback: timedelta=None) -> int:
+        # apply every change since the store's watermark for feed_name to store (SQLiteSnapshotStore, JsonWatermarkStore
+        # or anything with get_watermark/apply that honours doctype_match), batch by batch, returns the number of rows applied.
+        # feed_name defaults to one feed per doctype list, extra conditions need their own feed_name
+        feed_name = self._feed_name(feed_name, docType)
+        applied = 0
+        for batch in self.iter_changes(docType, store.get_watermark(feed_name), batch_size, conditions, lookback):
+            store.apply(feed_name, batch.rows, batch.watermark)
+            applied += len(batch.rows)
+        return applied
+
+    @reader_method
+    def get_change_sups(self, subids: list, since: datetime=datetime(2025, 1, 1)) -> List:
+        query = self._cached_all(self._change_sups_statement(subids, since))
         self.session.commit()
         pma_change_sups = [record[0] for record in query]
-        return pma_change_sups
\ No newline at end of file
+        return pma_change_sups
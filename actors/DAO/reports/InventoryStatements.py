@@ -0,0 +1,295 @@
+from datetime import datetime, timedelta
+from typing import List
+from sqlalchemy_example.domain.reports.Inventory import Inv
+from sqlalchemy_example.actors.ChangeFeed import Watermark
+
+from sqlalchemy import or_, and_
+from sqlalchemy.orm import Query, aliased
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.expression import BinaryExpression
+from sqlalchemy import select, func, any_, case, false, literal, tuple_, union_all, String
+from sqlalchemy.dialects import postgresql
+
+
+class InvInventoryStatements(object):
+    # doctype conditions and inventory statement builders, mixed into InvInventoryReader and AsyncInvInventoryReader
+    # next to the PrimaryReader or AsyncPrimaryReader that executes them
+    id_chunk_size: int = 10000 # ids per statement before query_submission_id splits the lookup
+    # doctype predicates are built once per class, their literals compile to bound parameters so the
+    # statements that embed them share one compiled cache entry per shape
+    supported_doctypes = ["K", "P"]
+    # when a document last changed, must stay identical to the ix_inventory_changed_at_object_id expression on Inv
+    change_timestamp = func.coalesce(Inv.update_date, Inv.modify_date, Inv.creation_date)
+    pdoc_conditions_list = [
+        Inv.folder_id.regexp_match('P[0-9]{6,9}'),
+        Inv.object_id.regexp_match('.*?(.pdf|.doc)'),
+        func.lower(Inv.doc_validation_status)=='validated',
+        func.upper(Inv.uniquekey).contains("RESPONSE")==False,
+        func.upper(Inv.sub_type).contains('RESPONSE')==False,
+        Inv.doc_download_date.isnot(None)
+        ]
+    kfile_conditions_list = [
+        Inv.folder_id.startswith("K"),
+        Inv.object_id.endswith(".pdf"),
+        func.lower(Inv.doc_download_status)=='downloaded',
+        func.lower(Inv.doc_validation_status)=='validated',
+        or_(func.upper(Inv.uniquekey).startswith("/SUPPLEMENT")==False, Inv.uniquekey.is_(None)),
+        or_(func.upper(Inv.uniquekey).startswith("/AMENDMENT")==False, Inv.uniquekey.is_(None)),
+        or_(func.upper(Inv.sub_type).contains('CORRESPONDENCE')==False, Inv.uniquekey.is_(None)),
+        Inv.doc_download_date.isnot(None)
+        ]
+    nonkfile_conditions_list = [
+        Inv.folder_id.startswith("K")==False,
+        Inv.object_id.endswith(".pdf"),
+        func.lower(Inv.doc_download_status)=='downloaded',
+        func.lower(Inv.doc_validation_status)=='validated'
+    ]
+    doctype_and_statements = {
+        "K": and_(*kfile_conditions_list).self_group(),
+        "P": and_(*pdoc_conditions_list).self_group()
+    }
+
+    def _doctype_assessment(self, docType):
+        if len(docType)==1: # if the docType list has only one doctype
+            if docType[0] == "all":
+                return 1, self.supported_doctypes
+            else:
+                return 0, docType[0] # return the single string
+        else:
+            return 1, docType # return the list
+
+    def _condlist_switch(self, docType) -> List:
+        # returns a new list so callers can extend it without touching the shared class-level list
+        switch = {
+            "K": self.kfile_conditions_list,
+            "P": self.pdoc_conditions_list
+        }
+        return list(switch[docType])
+
+    def _format_supplement_ids(self, unformatted_supplement_ids):
+        formatted_supp_ids = [tuple(supp_id.split("/", 1)) for supp_id in unformatted_supplement_ids]
+        return formatted_supp_ids
+
+    def _generate_doctype_and_statement(self, docType, include_and_statement, additional_conditions=None):
+        if include_and_statement is True and additional_conditions is None:
+            return self.doctype_and_statements[docType] # prebuilt, nothing to add
+        doctype_condlist = self._condlist_switch(docType)
+        if additional_conditions is not None:
+            doctype_condlist.extend(additional_conditions)
+        to_return = {True: and_(*doctype_condlist).self_group(), False: doctype_condlist}
+        return to_return[include_and_statement]
+
+    def _get_condlist_by_doctype(self, docType, include_and_statement: bool, additional_conditions=None) -> List:
+        condlist_flag, docType = self._doctype_assessment(docType)
+        if condlist_flag==0: # if only one doctype, return that doctypes condition list in an and_()
+            doctype_and_statement = self._generate_doctype_and_statement(
+                docType,
+                include_and_statement=include_and_statement,
+                additional_conditions=additional_conditions
+            )
+            return doctype_and_statement
+        else: # if 1<doctype, return or_ in dynamically constructed condition lists based on submission types present
+            and_statements = []
+            for submission_type in docType:
+                doctype_and_statement = self._generate_doctype_and_statement(
+                    submission_type,
+                    include_and_statement=include_and_statement,
+                    additional_conditions=additional_conditions
+                )
+                and_statements.append(doctype_and_statement)
+            return and_statements
+
+    def _doctype_statement(self, docType) -> BinaryExpression:
+        # single clause for one or more doctypes, multiple doctypes match any one of their condition sets
+        docType_statement = self._get_condlist_by_doctype(docType, include_and_statement=True)
+        if isinstance(docType_statement, list):
+            docType_statement = or_(*docType_statement)
+        return docType_statement
+
+    def _folder_id_conditions(self, cond: List, docType: str) -> tuple:
+        # returns the condition list and how to combine it, a single doctype ANDs its conditions, several are OR'ed
+        condlist_flag, docType = self._doctype_assessment(docType)
+        if condlist_flag==0:
+            tmp_cond_list = self._get_condlist_by_doctype(
+                docType,
+                include_and_statement=False,
+                additional_conditions=cond
+            )
+            return tmp_cond_list, "and"
+        tmp_cond_list = self._get_condlist_by_doctype(
+            docType,
+            include_and_statement=True,
+            additional_conditions=cond
+        )
+        return tmp_cond_list, "or"
+
+    def _folder_ids_from_records(self, query: List, return_query: bool=False):
+        if len(query) > 0:
+            if return_query is False:
+                folder_ids = list(set([record[1] for record in query]))
+                return folder_ids
+            if return_query is True:
+                folder_ids = list(set([record[1] for record in query]))
+                return folder_ids, query
+
+    def _folder_ids_from_distinct_records(self, query: List, return_query: bool=False):
+        # distinct lookups fetch (folder_id,) rows, return_query then returns those rows
+        if len(query) > 0:
+            folder_ids = [record[0] for record in query]
+            return {True: (folder_ids, query), False: folder_ids}[return_query]
+        return None
+
+    def _folder_id_subquery(self, cond: List, docType: str) -> Select:
+        # folder ids with at least one document matching cond for docType, for use inside IN ()
+        tmp_cond_list, filter_type = self._folder_id_conditions(cond, docType)
+        return select(Inv.folder_id).where(self.filter_type_switch(filter_type)(*tmp_cond_list))
+
+    def _creationdate_range_conditions(self, date_range: List, docType: list) -> List:
+        startDate, endDate = date_range
+        daterange_conditions: List[BinaryExpression] = [
+            startDate <= Inv.creation_date,
+            Inv.creation_date <= endDate
+        ] # create list with date range conditions
+        return [
+            self._doctype_statement(docType),
+            Inv.folder_id.in_(self._folder_id_subquery(daterange_conditions, docType))
+        ]
+
+    def _creationdate_exact_conditions(self, searchDate, docType: list) -> List:
+        doctype_statement = self._get_condlist_by_doctype(docType, include_and_statement=True)
+        date_statement = searchDate == Inv.creation_date
+        return [doctype_statement, date_statement]
+
+    def _chunk_ids(self, ids: List, chunk_size: int=None) -> List[List]:
+        chunk_size = chunk_size or self.id_chunk_size
+        return [ids[start:start + chunk_size] for start in range(0, len(ids), chunk_size)]
+
+    def _folder_id_match(self, folder_ids: List[str]):
+        # postgresql binds the whole id list as one array parameter, other dialects use an expanding IN
+        if self.engine.dialect.name == "postgresql":
+            return Inv.folder_id == any_(literal(folder_ids, postgresql.ARRAY(String)))
+        return Inv.folder_id.in_(folder_ids)
+
+    def _supplement_id_match(self, supplement_ids: List[tuple]):
+        # composite (folder_id, uniquekey) match, postgresql unnests two array parameters instead of binding every pair.
+        # the plain folder_id match is redundant but indexable, sqlite cannot search an index for a row value IN list
+        supplement_keys = [(subid, f"/{supp}") for subid, supp in supplement_ids]
+        folder_id_match = self._folder_id_match(list(dict.fromkeys(subid for subid, _ in supplement_keys)))
+        if self.engine.dialect.name == "postgresql":
+            folder_ids, uniquekeys = [list(values) for values in zip(*supplement_keys)]
+            supplement_pairs = func.unnest(
+                literal(folder_ids, postgresql.ARRAY(String)),
+                literal(uniquekeys, postgresql.ARRAY(String))
+            ).table_valued("folder_id", "uniquekey").render_derived()
+            return and_(folder_id_match, tuple_(Inv.folder_id, Inv.uniquekey).in_(
+                select(supplement_pairs.c.folder_id, supplement_pairs.c.uniquekey)
+            ))
+        return and_(folder_id_match, tuple_(Inv.folder_id, Inv.uniquekey).in_(supplement_keys))
+
+    def _submission_id_parts(self, folder_ids: List[str], supplement_ids: List[tuple], docType_statement, overlap_folder_ids: List[str]=None) -> List:
+        # overlap_folder_ids: every plain folder id of the lookup, defaults to folder_ids. a supplement document of one of
+        # those folders that meets the doctype conditions is returned by the folder id part only, however the ids are chunked
+        part_statements = []
+        if len(folder_ids) > 0:
+            part_statements.append(and_(docType_statement, self._folder_id_match(folder_ids)))
+        if len(supplement_ids) > 0:
+            supplement_statement = and_(self._supplement_id_match(supplement_ids), Inv.object_id.endswith(".pdf"))
+            supplement_folder_ids = set(subid for subid, _ in supplement_ids)
+            overlap = [folder_id for folder_id in (folder_ids if overlap_folder_ids is None else overlap_folder_ids) if folder_id in supplement_folder_ids]
+            if len(overlap) > 0:
+                supplement_statement = and_(supplement_statement, and_(docType_statement, self._folder_id_match(overlap)).is_not(True))
+            part_statements.append(supplement_statement)
+        if len(part_statements) == 0: # an empty id list matches nothing rather than the whole table
+            part_statements.append(false())
+        return part_statements
+
+    def _split_submission_ids(self, submission_id: List) -> tuple:
+        # repeated ids are dropped first, so no path returns a document twice because its id was passed twice
+        submission_id = list(dict.fromkeys(submission_id))
+        folder_ids = [subid for subid in submission_id if "/" not in subid]
+        supplement_ids = self._format_supplement_ids([subid for subid in submission_id if "/" in subid]) # returns list of tuples
+        return folder_ids, supplement_ids
+
+    def _submission_id_query(self, folder_ids: List[str], supplement_ids: List[tuple], docType_statement, order=None, order_attr=None, columns: List=None,
+                             overlap_folder_ids: List[str]=None) -> Query:
+        # plain folder ids and supplement ids are fetched by one UNION ALL statement, supplements keep only .pdf documents.
+        # each branch is planned on its own and keeps its index path, an OR of the two parts would not.
+        # order uses _merge_order_by so chunks sort NULLs the way _merge_ordered expects on every dialect
+        part_statements = self._submission_id_parts(folder_ids, supplement_ids, docType_statement, overlap_folder_ids)
+        if len(part_statements) == 1:
+            query: Query = self.construct_query_obj(columns or Inv).filter(part_statements[0])
+            if order is not None:
+                query = query.order_by(self._merge_order_by(order, order_attr))
+            return query
+        branch_columns = columns or list(Inv.__table__.columns)
+        parts = union_all(*[
+            select(*branch_columns, literal(number).label("submission_part")).where(part_statement)
+            for number, part_statement in enumerate(part_statements)
+        ]).subquery("submission_parts")
+        selected = [parts.c[column.key] for column in columns] if columns else [aliased(Inv, parts)]
+        # submission rows come before supplement rows, as when they were separate queries
+        query: Query = self.construct_query_obj(selected).order_by(parts.c.submission_part)
+        if order is not None:
+            query = query.order_by(self._merge_order_by(order, parts.c[order_attr.key]))
+        return query
+
+    def _submission_id_query_groups(self, submission_id: List, docType: list, order=None, order_attr=None, columns: List=None,
+                                    chunk_size: int=None) -> List[List]:
+        # one statement per id chunk, grouped so that submission chunks come before supplement chunks
+        chunk_size = chunk_size or self.id_chunk_size
+        docType_statement = self._doctype_statement(docType)
+        folder_ids, supplement_ids = self._split_submission_ids(submission_id)
+
+        if len(folder_ids) + len(supplement_ids) <= chunk_size:
+            return [[self._submission_id_query(folder_ids, supplement_ids, docType_statement, order, order_attr, columns)]]
+        return [
+            [self._submission_id_query(chunk, [], docType_statement, order, order_attr, columns) for chunk in self._chunk_ids(folder_ids, chunk_size)],
+            [
+                self._submission_id_query([], chunk, docType_statement, order, order_attr, columns, overlap_folder_ids=folder_ids)
+                for chunk in self._chunk_ids(supplement_ids, chunk_size)
+            ]
+        ]
+
+    def doctype_column(self, docType: list=["all"]):
+        # labels every row with the first of docType whose conditions it meets, NULL when it meets none
+        condlist_flag, doctypes = self._doctype_assessment(docType)
+        doctypes = doctypes if condlist_flag == 1 else [doctypes]
+        return case(*[(self.doctype_and_statements[doctype], doctype) for doctype in doctypes], else_=None).label("doctype")
+
+    def _aggregate_inventory_args(self, group_by: List, docType: list, conditions: List=None, grouping_sets: List[List]=None) -> tuple:
+        # "doctype" in group_by or grouping_sets stands for doctype_column(docType)
+        group_by = [self.doctype_column(docType) if isinstance(column, str) else column for column in group_by]
+        condition_list = [self._doctype_statement(docType)] + list(conditions or [])
+        return condition_list, group_by, grouping_sets
+
+    def _change_sups_statement(self, subids: list, since: datetime):
+        condition_list = self._get_condlist_by_doctype(docType=['P'],include_and_statement=True)
+        return select(func.distinct(Inv.folder_id + Inv.uniquekey)).where(
+            condition_list,
+            Inv.folder_id.in_(subids),
+            func.lower(Inv.uniquekey).contains('supplement'),
+            func.length(Inv.uniquekey) > 1,
+            Inv.uniquekey.is_not(None),
+            Inv.creation_date >= since
+        )
+
+    def _changes_statement(self, docType: list, conditions: List, after: Watermark, batch_size: int, lookback: timedelta=None) -> Select:
+        # rows with a change timestamp after the watermark in (change timestamp, object_id) order. documents without any
+        # timestamp are never part of a feed, deleted documents cannot be seen at all.
+        # the doctype is a doctype_match column rather than a filter, a document changed so that it no longer matches
+        # docType is still read and its consumer can drop it
+        changed_at = self.change_timestamp
+        statement = select(
+            changed_at.label("changed_at"),
+            *Inv.__table__.columns,
+            case((self._doctype_statement(docType), True), else_=False).label("doctype_match")
+        ).where(changed_at.is_not(None), *(conditions or []))
+        if after is not None and lookback:
+            # re-read a window behind the watermark for changes committed late with an earlier timestamp
+            statement = statement.where(changed_at >= after.changed_at - lookback)
+        elif after is not None:
+            statement = statement.where(self._keyset_predicate("min", changed_at, Inv.object_id, after.changed_at, after.object_id, nullable=False))
+        return statement.order_by(*self._keyset_order_by("min", changed_at, Inv.object_id)).limit(batch_size)
+
+    def _feed_name(self, feed_name: str, docType: list) -> str:
+        return feed_name or "inventory:" + ",".join(docType)
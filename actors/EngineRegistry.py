@@ -0,0 +1,163 @@
+# process-wide registry of engines, sessionmakers and parsed config files shared by all reader objects
+import logging
+import threading
+import configparser
+import sqlalchemy
+from typing import TYPE_CHECKING, Dict, Tuple
+from sqlalchemy.engine import Engine, URL
+from sqlalchemy.orm import sessionmaker
+
+if TYPE_CHECKING: # asyncio extras are imported lazily at runtime
+    from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+logger = logging.getLogger("sqlalchemy_example.engine_registry")
+
+
+class EngineRegistry(object):
+    # default pool settings, overridden by a "<cloud> PoolVals" config section or reader kwargs
+    default_pool_options: Dict = {
+        "pool_size": 5,
+        "max_overflow": 10,
+        "pool_pre_ping": True,
+        "pool_recycle": 1800,
+    }
+    _lock = threading.RLock()
+    _configs: Dict[str, configparser.RawConfigParser] = {}
+    _engines: Dict[Tuple, Engine] = {}
+    _engine_options: Dict[Tuple, Dict] = {} # engine kwargs each shared engine was created with
+    # sync and async sessionmakers are kept apart, get_sessionmaker must never hand back an async_sessionmaker
+    _sessionmakers: Dict[int, sessionmaker] = {}
+    _async_sessionmakers: Dict[int, "async_sessionmaker"] = {}
+
+    @classmethod
+    def get_config(cls, config_file: str) -> configparser.RawConfigParser:
+        # config files are parsed once per process and shared, readers must treat them as read-only
+        with cls._lock:
+            if config_file not in cls._configs:
+                config = configparser.RawConfigParser()
+                config.read(config_file)
+                cls._configs[config_file] = config
+            return cls._configs[config_file]
+
+    @classmethod
+    def pool_options_from_config(cls, config: configparser.RawConfigParser, section: str) -> Dict:
+        pool_options = dict(cls.default_pool_options)
+        if config.has_section(section):
+            getters = {
+                "pool_size": config.getint,
+                "max_overflow": config.getint,
+                "pool_pre_ping": config.getboolean,
+                "pool_recycle": config.getint,
+                "pool_timeout": config.getint,
+            }
+            for option, getter in getters.items():
+                if config.has_option(section, option):
+                    pool_options[option] = getter(section, option)
+        return pool_options
+
+    @staticmethod
+    def _engine_key(url: URL, schema_translate_map: Dict, echo: bool) -> Tuple:
+        # URL renders with password hidden by default, so render it fully to keep distinct credentials apart
+        schema_key = tuple(sorted(schema_translate_map.items())) if schema_translate_map else None
+        return url.render_as_string(hide_password=False), schema_key, echo
+
+    @classmethod
+    def _shared_engine(cls, key: Tuple, create, url: URL, schema_translate_map: Dict, echo: bool, pool_options: Dict):
+        # pool options only apply on first creation, a later request for the same target with other options gets the
+        # existing engine and a warning
+        engine_kwargs = dict(cls.default_pool_options)
+        engine_kwargs.update(pool_options)
+        if schema_translate_map:
+            engine_kwargs["execution_options"] = {"schema_translate_map": dict(schema_translate_map)}
+        with cls._lock:
+            engine = cls._engines.get(key)
+            if engine is None:
+                engine = create(url, echo=echo, **engine_kwargs)
+                cls._engines[key] = engine
+                cls._engine_options[key] = engine_kwargs
+            elif cls._engine_options.get(key) not in (None, engine_kwargs):
+                logger.warning(
+                    "engine for %s already exists with %s, ignoring %s",
+                    url.render_as_string(hide_password=True), cls._engine_options[key], engine_kwargs
+                )
+            return engine
+
+    @classmethod
+    def get_engine(cls, url: URL, schema_translate_map: Dict = None, echo: bool = False, **pool_options) -> Engine:
+        # one pooled engine per (url, schema_translate_map, echo) target
+        key = cls._engine_key(url, schema_translate_map, echo)
+        return cls._shared_engine(key, sqlalchemy.create_engine, url, schema_translate_map, echo, pool_options)
+
+    @classmethod
+    def register_engine(cls, url: URL, engine: Engine, schema_translate_map: Dict = None, echo: bool = False) -> Engine:
+        # install a prebuilt engine for the target readers resolve from their config, e.g. a benchmark or sqlite database
+        with cls._lock:
+            key = cls._engine_key(url, schema_translate_map, echo)
+            cls._engines[key] = engine
+            cls._engine_options.pop(key, None)
+            cls._sessionmakers.pop(id(engine), None)
+            cls._async_sessionmakers.pop(id(engine), None)
+            return engine
+
+    @classmethod
+    def get_async_engine(cls, url: URL, schema_translate_map: Dict = None, echo: bool = False, **pool_options) -> "AsyncEngine":
+        # asyncio counterpart of get_engine, the pool belongs to the event loop that first uses it
+        # imported here so sync readers do not need the asyncio extras (greenlet, an async driver)
+        from sqlalchemy.ext.asyncio import create_async_engine
+        key = ("async",) + cls._engine_key(url, schema_translate_map, echo)
+        return cls._shared_engine(key, create_async_engine, url, schema_translate_map, echo, pool_options)
+
+    @classmethod
+    def get_async_sessionmaker(cls, engine: "AsyncEngine") -> "async_sessionmaker":
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+        with cls._lock:
+            session_maker = cls._async_sessionmakers.get(id(engine))
+            if session_maker is None:
+                session_maker = async_sessionmaker(bind=engine)
+                cls._async_sessionmakers[id(engine)] = session_maker
+            return session_maker
+
+    @classmethod
+    def get_sessionmaker(cls, engine: Engine) -> sessionmaker:
+        with cls._lock:
+            session_maker = cls._sessionmakers.get(id(engine))
+            if session_maker is None:
+                session_maker = sessionmaker(bind=engine)
+                cls._sessionmakers[id(engine)] = session_maker
+            return session_maker
+
+    @classmethod
+    def _take_all(cls) -> list:
+        # forget every engine, sessionmaker and config, returns the engines for the caller to dispose
+        with cls._lock:
+            engines = list(cls._engines.values())
+            cls._engines.clear()
+            cls._engine_options.clear()
+            cls._sessionmakers.clear()
+            cls._async_sessionmakers.clear()
+            cls._configs.clear()
+        return engines
+
+    @classmethod
+    def dispose_all(cls, close: bool = True):
+        # drop every engine and its pooled connections, readers created afterwards get new engines.
+        # close: True closes the connections (shutdown, tests). in a forked worker pass False, the connections still
+        # belong to the parent process and are only forgotten, closing them would close the parent's sockets.
+        # async pools are always forgotten with close=False here, their connections can only be closed awaited on
+        # the event loop: call dispose_all_async() from async code instead
+        for engine in cls._take_all():
+            if hasattr(engine, "sync_engine"):
+                engine.sync_engine.dispose(close=False)
+            else:
+                engine.dispose(close=close)
+        return
+
+    @classmethod
+    async def dispose_all_async(cls, close: bool = True):
+        # dispose_all for async code, AsyncEngine.dispose() is awaited so async pools close their connections too
+        for engine in cls._take_all():
+            if hasattr(engine, "sync_engine"):
+                await engine.dispose(close=close)
+            else:
+                engine.dispose(close=close)
+        return
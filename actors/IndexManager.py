@@ -0,0 +1,63 @@
+# creates the indexes declared in a domain object's __table_args__ on an existing table
+from typing import List, Set, Union
+import sqlalchemy
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import DeclarativeMeta
+from sqlalchemy.schema import CreateIndex, Index, Table
+
+
+class IndexManager(object):
+    # bind: an Engine, or a Connection such as the one AsyncConnection.run_sync passes in
+
+    @staticmethod
+    def declared_indexes(tableDomainObj: DeclarativeMeta) -> List[Index]:
+        return sorted(tableDomainObj.__table__.indexes, key=lambda index: index.name)
+
+    @staticmethod
+    def _translated_schema(bind: Union[Engine, Connection], schema: str) -> str:
+        # reflection does not apply schema_translate_map, DDL execution does
+        return (bind.get_execution_options().get("schema_translate_map") or {}).get(schema, schema)
+
+    @classmethod
+    def existing_index_names(cls, bind: Union[Engine, Connection], table: Table) -> Set[str]:
+        if isinstance(bind, Engine):
+            with bind.connect() as conn:
+                return cls.existing_index_names(conn, table)
+        schema = cls._translated_schema(bind, table.schema)
+        if bind.dialect.name == "sqlite": # sqlite reflection skips expression indexes, read them from the catalog
+            catalog = f"{schema}.sqlite_master" if schema else "sqlite_master"
+            return set(bind.exec_driver_sql(
+                f"SELECT name FROM {catalog} WHERE type = 'index' AND tbl_name = ?", (table.name,)
+            ).scalars())
+        return {index["name"] for index in sqlalchemy.inspect(bind).get_indexes(table.name, schema=schema)}
+
+    @classmethod
+    def missing_indexes(cls, bind: Union[Engine, Connection], tableDomainObj: DeclarativeMeta) -> List[Index]:
+        existing = cls.existing_index_names(bind, tableDomainObj.__table__)
+        return [index for index in cls.declared_indexes(tableDomainObj) if index.name not in existing]
+
+    @classmethod
+    def create_indexes(cls, bind: Union[Engine, Connection], tableDomainObj: DeclarativeMeta, concurrently: bool=False) -> List[str]:
+        # returns the names of the indexes created, existing ones are left alone.
+        # concurrently: postgresql builds each index without blocking writes, outside a transaction and more slowly.
+        # an engine gets a connection of its own, a connection passed in is committed when done and must already be
+        # in AUTOCOMMIT for concurrently
+        concurrently = concurrently and bind.dialect.name == "postgresql"
+        if isinstance(bind, Engine):
+            with bind.connect() as conn:
+                if concurrently is True:
+                    conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+                return cls.create_indexes(conn, tableDomainObj, concurrently=concurrently)
+        created = []
+        for index in cls.missing_indexes(bind, tableDomainObj):
+            if concurrently is True:
+                index.dialect_options["postgresql"]["concurrently"] = True
+            try:
+                bind.execute(CreateIndex(index, if_not_exists=True))
+            finally:
+                if concurrently is True:
+                    index.dialect_options["postgresql"]["concurrently"] = False
+            created.append(index.name)
+        if concurrently is False:
+            bind.commit()
+        return created
@@ -0,0 +1,53 @@
+# opaque page cursors for keyset pagination, url safe base64 of the last row's sort key
+import base64
+import json
+from collections import namedtuple
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict
+
+# records: the rows of this page, next_cursor: token for the following page, None on the last page
+Page = namedtuple("Page", ["records", "next_cursor"])
+
+
+def encode_value(value: Any) -> Any:
+    # JSON has no dates or decimals, tag them so they come back as the same python type
+    if isinstance(value, datetime):
+        return {"datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"date": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"decimal": str(value)}
+    return value
+
+
+def decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        value_type, encoded = next(iter(value.items()))
+        return {
+            "datetime": datetime.fromisoformat,
+            "date": date.fromisoformat,
+            "decimal": Decimal,
+        }[value_type](encoded)
+    return value
+
+
+def encode_cursor(order: str, order_key: str, tie_key: str, last_value: Any, last_tie: Any) -> str:
+    payload = {"o": order, "a": order_key, "t": tie_key, "v": encode_value(last_value), "k": encode_value(last_tie)}
+    token = base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode()
+    return token.rstrip("=")
+
+
+def decode_cursor(token: str, order: str, order_key: str, tie_key: str) -> Dict:
+    # a cursor only resumes the ordering it was issued for
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        cursor = {
+            "order": payload["o"], "order_key": payload["a"], "tie_key": payload["t"],
+            "last_value": decode_value(payload["v"]), "last_tie": decode_value(payload["k"]),
+        }
+    except (ValueError, KeyError, TypeError, AttributeError, StopIteration) as e:
+        raise ValueError("invalid page cursor") from e
+    if (cursor["order"], cursor["order_key"], cursor["tie_key"]) != (order, order_key, tie_key):
+        raise ValueError(f"page cursor was issued for order={cursor['order']} on {cursor['order_key']}, not order={order} on {order_key}")
+    return cursor
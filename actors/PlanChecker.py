@@ -0,0 +1,110 @@
+# EXPLAINs the statements reader methods execute and reports the ones that sequentially scan a watched table
+import contextlib
+import json
+from typing import Callable, Dict, Iterator, List
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy_example.actors.ReaderMetrics import current_reader_method, UNTRACKED_METHOD
+
+
+class SequentialScanError(AssertionError):
+    pass
+
+
+class PlanChecker(object):
+    # relations: unqualified table names a sequential scan is reported for
+    # disable_seqscan: plan with enable_seqscan=off on postgresql, so on a small test database the planner still picks
+    # an index when one can serve the statement and the remaining sequential scans are the ones no index covers
+    def __init__(self, engine: Engine, relations: List[str]=("inventory",), disable_seqscan: bool=False):
+        self.engine: Engine = getattr(engine, "sync_engine", engine)
+        self.relations: List[str] = list(relations)
+        self.disable_seqscan: bool = disable_seqscan
+
+    @contextlib.contextmanager
+    def capture(self) -> Iterator[List[tuple]]:
+        # collects (reader method, statement, parameters) for every single-row-set SELECT executed in the block
+        captured = []
+
+        def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if executemany is False and statement.lstrip().upper().startswith(("SELECT", "WITH")):
+                captured.append((current_reader_method.get() or UNTRACKED_METHOD, statement, parameters))
+
+        event.listen(self.engine, "before_cursor_execute", _before_cursor_execute)
+        try:
+            yield captured
+        finally:
+            event.remove(self.engine, "before_cursor_execute", _before_cursor_execute)
+
+    def explain(self, statement: str, parameters) -> object:
+        # postgresql: the JSON plan tree, sqlite: the EXPLAIN QUERY PLAN detail strings
+        with self.engine.connect() as conn:
+            if self.engine.dialect.name == "postgresql":
+                if self.disable_seqscan is True:
+                    conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+                plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters).scalar()
+                conn.rollback()
+                return json.loads(plan) if isinstance(plan, str) else plan
+            rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+            return [row[-1] for row in rows]
+
+    def _postgresql_scans(self, node: Dict) -> List[str]:
+        scans = []
+        if node.get("Node Type") == "Seq Scan" and node.get("Relation Name") in self.relations:
+            scans.append(node["Relation Name"])
+        for child in node.get("Plans", []):
+            scans.extend(self._postgresql_scans(child))
+        return scans
+
+    def _sqlite_scans(self, details: List[str]) -> List[str]:
+        # "SCAN inventory" reads every row, "SCAN inventory USING [COVERING] INDEX ..." walks an index instead
+        scans = []
+        for detail in details:
+            words = detail.split()
+            if len(words) >= 2 and words[0] == "SCAN" and "USING" not in words:
+                relation = words[1].split(".")[-1]
+                if relation in self.relations:
+                    scans.append(relation)
+        return scans
+
+    def sequential_scans(self, plan) -> List[str]:
+        if self.engine.dialect.name == "postgresql":
+            return [scan for root in plan for scan in self._postgresql_scans(root["Plan"])]
+        return self._sqlite_scans(plan)
+
+    def check(self, fn: Callable, *args, **kwargs) -> List[Dict]:
+        # runs fn, then explains every statement it executed. one finding per statement
+        with self.capture() as captured:
+            result = fn(*args, **kwargs)
+            if hasattr(result, "__next__"): # streamed results only execute while they are consumed
+                for _ in result:
+                    pass
+        findings = []
+        for method_name, statement, parameters in captured:
+            plan = self.explain(statement, parameters)
+            findings.append({
+                "method": method_name,
+                "statement": statement,
+                "sequential_scans": self.sequential_scans(plan),
+                "plan": plan,
+            })
+        return findings
+
+    def assert_index_paths(self, fn: Callable, *args, **kwargs) -> List[Dict]:
+        findings = self.check(fn, *args, **kwargs)
+        failures = [finding for finding in findings if len(finding["sequential_scans"]) > 0]
+        if len(failures) > 0:
+            raise SequentialScanError(self.format_report(failures))
+        return findings
+
+    @staticmethod
+    def format_report(findings: List[Dict]) -> str:
+        lines = []
+        for finding in findings:
+            status = "SEQ SCAN " + ", ".join(finding["sequential_scans"]) if finding["sequential_scans"] else "ok"
+            if finding["sequential_scans"] and finding.get("full_scan") is True:
+                status += " (expected, full scan case)"
+            label = f"{finding['case']} ({finding['method']})" if "case" in finding else finding["method"]
+            lines.append(f"{label}: {status}")
+            if finding["sequential_scans"] and finding.get("full_scan") is not True:
+                lines.append("    " + " ".join(finding["statement"].split())[:400])
+        return "\n".join(lines)
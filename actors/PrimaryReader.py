@@ -1,73 +1,130 @@
 # parent reader class for all other reader objects
-import os
 import sqlalchemy
-from sqlalchemy import exc, update
-from typing import List, Union
-from sqlalchemy import or_, and_
-from sqlalchemy.engine import Engine, URL
+from sqlalchemy import event, exc
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from typing import Iterable, Iterator, List, Union
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session, DeclarativeMeta, Query
-from sqlalchemy.sql.expression import BinaryExpression, func
-import configparser
-
-class PrimaryReader(object):
-    def __init__(self, echo_state: bool = False, table_type: str='app_input'):
-        self.echo_state: bool = echo_state
-        self.config_file: str = os.path.abspath("./config/primary_config.ini")
-        self.config: configparser.RawConfigParser = configparser.RawConfigParser()
-        self.config.read(self.config_file)
-        self.test_mode: int = self.config.getint('TestModeVar','test_mode')
-        self.table_type = table_type
-        self.active_env: str = self.config.get('ActiveEnvVar', 'active_env')
-        self.cloud = 'cloud_name'
-        self.DB_CONN = {
-            True: URL.create(
-                "postgresql",
-                username=self.config.get(f"{self.cloud} TestConnVals", "username"),
-                password=self.config.get(f"{self.cloud} TestConnVals", "password"),
-                host=self.config.get(f"{self.cloud} TestConnVals", "rds"),
-                port=self.config.get(f"{self.cloud} TestConnVals", "port"),
-                database=self.config.get(f"{self.cloud} TestConnVals", "service_name")
-            ),
-            False: URL.create(
-                "postgresql",
-                username=self.config.get(f"{self.cloud} PreProdConnVals", "username"),
-                password=self.config.get(f"{self.cloud} PreProdConnVals", "password"),
-                host=self.config.get(f"{self.cloud} PreProdConnVals", "rds"),
-                port=self.config.get(f"{self.cloud} PreProdConnVals", "port"),
-                database=self.config.get(f"{self.cloud} PreProdConnVals", "service_name")
-            )
-        }[self.test_mode>0]
-        engine_lookup_key = self.test_mode>0
-        if self.cloud == 'test_cloud_name':
-            engine_lookup_key = self.test_mode==0
-        self.engine: Engine = {
-            True: sqlalchemy.create_engine(
-                self.DB_CONN,
-                echo=self.echo_state,
-                execution_options={
-                    "schema_translate_map": dict(self.config.items(f'{self.cloud} SchemaTranslateMap'))
-                }
-            ),
-            False: sqlalchemy.create_engine(self.DB_CONN, echo=self.echo_state)
-        }[engine_lookup_key]
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.expression import BinaryExpression
+from sqlalchemy_example.actors.EngineRegistry import EngineRegistry
+from sqlalchemy_example.actors.IndexManager import IndexManager
+from sqlalchemy_example.actors.KeysetCursor import Page
+from sqlalchemy_example.actors.ReaderMetrics import reader_method
+from sqlalchemy_example.actors.ReaderStatements import ReaderStatements
+from sqlalchemy_example.actors.ResultCache import ResultCache
+from sqlalchemy_example.actors.ColumnarResult import build_columnar
+
+class PrimaryReader(ReaderStatements):
+    # sync execution on a Session, statement construction comes from ReaderStatements
+    def __init__(self, echo_state: bool = False, table_type: str='app_input', pool_options: dict=None, result_cache: ResultCache=None,
+                 parallel_workers: int=None):
+        # pool_options: overrides for pool_size, max_overflow, pool_pre_ping, pool_recycle and pool_timeout
+        # result_cache: optional ResultCache, may be shared between readers, consulted by methods that read with use_cache
+        # parallel_workers: split large non-streaming reads into partitions run on up to this many pooled connections at
+        # once, keep it within pool_size + max_overflow
+        self._read_connection_config(echo_state, table_type, pool_options)
+        self.result_cache: ResultCache = result_cache
+        self.parallel_workers: int = parallel_workers
+        self._written_tables: set = set() # tables written in the session's open transaction, see _track_written_tables
+        # engines are shared process-wide so creating a reader does not open a new connection pool
+        self.engine: Engine = EngineRegistry.get_engine(
+            self.DB_CONN,
+            schema_translate_map=self.schema_translate_map,
+            echo=self.echo_state,
+            **self.pool_options
+        )
         self.session: Session = None
 
 
     def connect(self):
         try:
-            pw_tmp = self.DB_CONN.password
-            self.engine.driver
-            session_maker = sqlalchemy.orm.sessionmaker(bind=self.engine)
+            session_maker = EngineRegistry.get_sessionmaker(self.engine)
             self.session: Session = session_maker()
+            if self.result_cache is not None:
+                self._track_written_tables(self.session)
 
         except exc.SQLAlchemyError as e:
             print(f"{type(e)} | {str(e)}")
-            
-            
+
+
     def disconnect(self):
         self.session.close()
-    
-                
+
+
+    def _track_written_tables(self, session: Session):
+        # ORM changes are often flushed before the commit (autoflush ahead of a query), so the tables they write are
+        # collected on every flush, and on every insert/update/delete statement run through the session, and
+        # invalidated in the result cache once the transaction commits, whatever commits it.
+        # _cached_all reads around the cache while writes are pending, so a rollback leaves nothing to invalidate
+        def _after_flush(session, flush_context):
+            self._written_tables.update(record.__table__.fullname for record in chain(session.new, session.dirty, session.deleted))
+
+        def _do_orm_execute(orm_execute_state):
+            if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+                self._written_tables.add(orm_execute_state.statement.table.fullname)
+
+        def _after_commit(session):
+            if len(self._written_tables) > 0:
+                self._invalidate_cache(self._written_tables)
+                self._written_tables.clear()
+
+        def _after_rollback(session):
+            self._written_tables.clear()
+
+        event.listen(session, "after_flush", _after_flush)
+        event.listen(session, "do_orm_execute", _do_orm_execute)
+        event.listen(session, "after_commit", _after_commit)
+        event.listen(session, "after_rollback", _after_rollback)
+        return
+
+
+    def create_indexes(self, tableDomainObj: DeclarativeMeta, concurrently: bool=False) -> List[str]:
+        # create the indexes tableDomainObj declares that are missing from the database, returns their names
+        return IndexManager.create_indexes(self._event_engine(), tableDomainObj, concurrently=concurrently)
+
+
+    def result_cache_stats(self) -> dict:
+        # hits, misses, evictions, invalidations and size of the result cache, empty without one
+        return self.result_cache.stats() if self.result_cache is not None else {}
+
+
+    def _cached_all(self, query: Union[Query, Select]) -> List:
+        # fetch all rows of a query or select, serving and storing them in the result cache when one is configured
+        if isinstance(query, Query):
+            statement, execute = query.statement, query.all
+        else:
+            statement, execute = query, lambda: self.session.execute(query).all()
+        if self.result_cache is None or self._has_uncommitted_writes():
+            return execute()
+        key = self.result_cache.make_key(statement, self.engine)
+        if key is None:
+            return execute()
+        hit, result = self.result_cache.get(key)
+        if hit is True:
+            return result
+        result = execute()
+        # the read itself may have autoflushed changes, its rows then include writes that are not committed yet
+        if self.result_cache.is_cacheable(result) and not self._has_uncommitted_writes():
+            self.result_cache.put(key, self.result_cache.table_names(statement), result)
+        return result
+
+
+    def _has_uncommitted_writes(self) -> bool:
+        # pending ORM changes would be autoflushed into the read, flushed or executed writes are visible to it until the
+        # transaction ends. neither is seen by other sessions, so such reads are neither served from nor stored in the cache
+        return len(self._written_tables) > 0 or len(self.session.new) + len(self.session.dirty) + len(self.session.deleted) > 0
+
+
+    def _invalidate_cache(self, tables):
+        # write-through invalidation, called once the write is committed
+        if self.result_cache is not None:
+            self.result_cache.invalidate(tables)
+        return
+
+
     def construct_query_obj(self, queryObject: Union[DeclarativeMeta, List]) -> Query:
         # generate query object from session that either targets all table columns or
         # returns select columns based on queryObject type provided declarativemeta is a table object
@@ -77,33 +134,162 @@ class PrimaryReader(object):
         else:
             query: Query = self.session.query(*queryObject)
         return query
-    
-    
-    def filter_type_switch(self, filter_flag: str):
-        # allows for more dynamically defined query construction
-        return {"and": and_, "or": or_}[filter_flag]
-
-    
-    def order_type_swtich(self, order_flag: str, order_attr):
-        return {"max": order_attr.desc(), "min": order_attr.asc()}[order_flag]
-    
-    
-    def filter_by_column(self, queryObject: Union[DeclarativeMeta, List], cond: BinaryExpression, filter_type: str="or", order: str=None, order_attr=None ) -> List:
+
+
+    @reader_method
+    def filter_by_column(self, queryObject: Union[DeclarativeMeta, List], cond: BinaryExpression, filter_type: str="or", order: str=None, order_attr=None,
+                         stream: bool=False, yield_per: int=1000, batched: bool=False, use_cache: bool=False, result_format: str="orm") -> Union[List, Iterator, dict]:
         # filter by list of binary expressions against table columns
+        # stream: return a generator over a server-side cursor instead of loading every row at once
+        # use_cache: serve column (non-ORM) results from the reader's result cache, ignored when streaming
+        # result_format: "orm" (objects/rows), or "numpy"/"arrow" for a columnar result, see _return_query
         query: Query = self.construct_query_obj(queryObject)
         filter_obj = self.filter_type_switch(filter_type) # can only be "and" or "or"
         if order is not None:
             order_attr_sort = self.order_type_swtich(order, order_attr)
-            result: List[queryObject] = query.order_by(order_attr_sort).filter(
+            query = query.order_by(order_attr_sort).filter(
                 (filter_obj(*cond))
-            ).all()
+            )
         else:
-            result: List[queryObject] = query.filter(
+            query = query.filter(
                 (filter_obj(*cond))
-            ).all()
+            )
+        if use_cache is True and stream is False:
+            return self._cached_all(query)
+        result = self._return_query(query, stream=stream, yield_per=yield_per, batched=batched, result_format=result_format)
         return result
-    
-    
+
+
+    def _return_query(self, query: Query, stream: bool=False, yield_per: int=1000, batched: bool=False, result_format: str="orm") -> Union[List, Iterator, dict]:
+        # materialize the query, or hand back a lazy generator when streaming
+        # columnar formats always read through a server-side cursor and ignore stream/batched
+        if result_format != "orm":
+            return self._columnar_result(result_format, [[query]], yield_per=yield_per)
+        if stream is False:
+            return query.all()
+        return self._stream_query(query, yield_per=yield_per, batched=batched)
+
+
+    def _column_statement(self, query: Query) -> Select:
+        # the same query selecting plain table columns, rows come back as tuples without ORM objects or identity tracking
+        return query.with_entities(*query.statement.selected_columns).statement
+
+
+    def _stream_column_rows(self, query: Query, yield_per: int=1000) -> Iterator:
+        result = self.session.execute(
+            self._column_statement(query),
+            execution_options={"stream_results": True, "yield_per": yield_per}
+        )
+        yield from result
+
+
+    def _columnar_result(self, result_format: str, query_groups: List[List[Query]], yield_per: int=1000, order: str=None, order_attr=None):
+        # build numpy/arrow columns from cursor batches, queries inside a group are merged in order_attr order
+        # and groups follow each other, every query must select the same columns
+        statement = self._column_statement(query_groups[0][0])
+        rows = chain(*[
+            self._merge_ordered([self._stream_column_rows(query, yield_per) for query in query_group], order, order_attr)
+            for query_group in query_groups
+        ])
+        return build_columnar(
+            result_format,
+            self._batch_stream(rows, yield_per),
+            [column.key for column in statement.selected_columns],
+            [column.type for column in statement.selected_columns]
+        )
+
+
+    def _stream_query(self, query: Query, yield_per: int=1000, batched: bool=False) -> Iterator:
+        # yield_per implies stream_results, so rows are fetched from a server-side cursor yield_per at a time
+        records = query.yield_per(yield_per)
+        if batched is True:
+            yield from self._batch_stream(records, yield_per)
+        else:
+            yield from records
+
+
+    @reader_method
+    def filter_by_column_page(self, queryObject: Union[DeclarativeMeta, List], cond: BinaryExpression, filter_type: str="or", order: str="min",
+                              order_attr=None, page_size: int=100, cursor: str=None) -> Page:
+        # keyset pagination over filter_by_column: rows ordered by (order_attr, primary key), page_size at a time.
+        # cursor: the next_cursor of the previous page, None for the first page. every page costs the same however deep
+        # and no transaction is held between pages. column selections must include order_attr and the primary key
+        query: Query = self.construct_query_obj(queryObject)
+        filter_obj = self.filter_type_switch(filter_type) # can only be "and" or "or"
+        return self._keyset_page(query.filter(filter_obj(*cond)), order, order_attr, page_size, cursor)
+
+
+    def _keyset_page(self, query: Query, order: str="min", order_attr=None, page_size: int=100, cursor: str=None) -> Page:
+        query, order_attr, tie_attr = self._keyset_page_query(query, order, order_attr, page_size, cursor)
+        # each page reads on a short lived session, the connection and its transaction go back to the pool straight away
+        with EngineRegistry.get_sessionmaker(self.engine)() as session:
+            result = session.execute(query.statement)
+            records = result.scalars().all() if self._is_entity_query(query) else result.all()
+        return self._page_from_records(records, order, order_attr, tie_attr, page_size)
+
+
+    def _partition_results(self, statements: List[Select], entities: bool) -> List[List]:
+        # run every statement on its own pooled connection and session, at most parallel_workers at a time.
+        # worker sessions are closed once their rows are fetched, so ORM objects come back detached with their columns loaded
+        session_maker = EngineRegistry.get_sessionmaker(self.engine)
+
+        def run_partition(statement: Select) -> List:
+            with session_maker() as session:
+                result = session.execute(statement)
+                return result.scalars().all() if entities else result.all()
+
+        with ThreadPoolExecutor(max_workers=min(self.parallel_workers, len(statements))) as executor:
+            # each worker runs in a copy of the caller's context so its statements count toward the calling reader method
+            futures = [executor.submit(contextvars.copy_context().run, run_partition, statement) for statement in statements]
+            return [future.result() for future in futures]
+
+
+    def _dedupe_entities(self, records: Iterable) -> Iterator:
+        # drop repeated domain objects (same primary key) coming from overlapping partitions, first one wins
+        seen = set()
+        for record in records:
+            identity = sqlalchemy.inspect(record).identity_key
+            if identity not in seen:
+                seen.add(identity)
+                yield record
+
+
+    def _parallel_result(self, query_groups: List[List[Query]], order: str=None, order_attr=None, result_format: str="orm",
+                         yield_per: int=1000) -> Union[List, dict]:
+        # parallel counterpart of running query_groups one query at a time: queries inside a group are merged in
+        # order_attr order, groups follow each other. every query must select the same entity or columns
+        queries = [query for query_group in query_groups for query in query_group]
+        entities = result_format == "orm" and self._is_entity_query(queries[0])
+        statements = [query.statement if result_format == "orm" else self._column_statement(query) for query in queries]
+        partition_results = iter(self._partition_results(statements, entities))
+        records = chain(*[
+            self._merge_ordered([next(partition_results) for _ in query_group], order, order_attr)
+            for query_group in query_groups
+        ])
+        if entities is True:
+            records = self._dedupe_entities(records)
+        if result_format != "orm":
+            return build_columnar(
+                result_format,
+                self._batch_stream(records, yield_per),
+                [column.key for column in statements[0].selected_columns],
+                [column.type for column in statements[0].selected_columns]
+            )
+        return list(records)
+
+
+    @reader_method
+    def aggregate(self, cond: List, filter_type: str="and", group_by: List=[], aggregates: dict={"count": "count"},
+                  grouping_sets: List[List]=None, result_format: str="orm") -> Union[List, dict]:
+        # server side GROUP BY over the rows matching cond, one row per group instead of every matching row
+        # group_by: columns or labelled expressions, aggregates: {label: "count" | (aggregate_type_switch flag, column)}
+        # grouping_sets: lists of group_by columns (or their keys) to aggregate by in the same statement, [] is the grand total
+        # result_format: "orm" for rows, "numpy"/"arrow" for columns
+        statement = self._aggregate_statement(cond, filter_type, group_by, aggregates, grouping_sets)
+        return self._aggregate_result(statement, self._cached_all(statement), result_format)
+
+
+    @reader_method
     def get_distinct_values(self, queryObject: Union[DeclarativeMeta, List], cond: BinaryExpression, filter_type: str="or") -> List:
         # filter by list of binary expressions against table columns
         query: Query = self.construct_query_obj(queryObject)
@@ -112,14 +298,16 @@ class PrimaryReader(object):
             (filter_obj(*cond))
         ).distinct()
         return result
-    
-    
+
+
+    @reader_method
     def insert_row(self, queryObject: Union[DeclarativeMeta, List]):
         self.session.add(queryObject)
         self.session.commit()
         return
 
-    
+
+    @reader_method
     def update_row(self, queryObject: Union[DeclarativeMeta, List], cond: BinaryExpression, update_tuple):
         # cond: column filtering conditional statement. should always match exactly one row
         # update_tuple: queryObject attribute to update w value to update with. example: ('column_name', 'value')
@@ -130,17 +318,57 @@ class PrimaryReader(object):
         self.session.commit()
         return
 
-    
-    def random_sample(self, tableDomainObj: DeclarativeMeta, sample_size: int, conditions: List=[]):
+
+    def _execute_bulk(self, statement_builder, tableDomainObj: DeclarativeMeta, rows: List, batch_size: int, index_elements: List[str]=None) -> int:
+        affected = 0
+        for batch_statements in self._bulk_batches(statement_builder, tableDomainObj, rows, batch_size, index_elements):
+            for statement, params, group in batch_statements:
+                result = self.session.execute(statement, params)
+                affected += self._affected_rows(result, group)
+            self.session.commit()
+        return affected
+
+
+    @reader_method
+    def insert_rows(self, tableDomainObj: DeclarativeMeta, rows: List, batch_size: int=1000) -> int:
+        # rows: domain objects or column mappings, sent as executemany inserts with one commit per batch
+        return self._execute_bulk(self._insert_statement, tableDomainObj, rows, batch_size)
+
+
+    @reader_method
+    def update_rows(self, tableDomainObj: DeclarativeMeta, rows: List, batch_size: int=1000) -> int:
+        # set-based update keyed by primary key, each mapping must carry the primary key plus the columns to set
+        return self._execute_bulk(self._update_statement, tableDomainObj, rows, batch_size)
+
+
+    @reader_method
+    def upsert_rows(self, tableDomainObj: DeclarativeMeta, rows: List, batch_size: int=1000, index_elements: List[str]=None) -> int:
+        # INSERT ... ON CONFLICT (index_elements) DO UPDATE as one multi-row statement per batch
+        # index_elements defaults to the primary key columns
+        return self._execute_bulk(self._upsert_statement, tableDomainObj, rows, batch_size, index_elements)
+
+
+    @reader_method
+    def random_sample(self, tableDomainObj: DeclarativeMeta, sample_size: int, conditions: List=[], sample_method: str="exact",
+                      seed: float=None, sample_percent: float=1.0):
         # uses table.column style filtering for random row selection filtering for ALL conditions if conditions provided.
-        query: Query = self.construct_query_obj(tableDomainObj)
-        if len(conditions) > 0:
-            random_sample: List[tableDomainObj] = query.filter(and_(*conditions)).order_by(func.random()).limit(sample_size).all()
-        else:
-            random_sample: List[tableDomainObj] = query.order_by(func.random()).limit(sample_size).all()
-        return random_sample
+        # sample_method: "exact" orders every matching row by random(), "system"/"bernoulli" only read a postgres
+        # TABLESAMPLE of the table, growing sample_percent until sample_size matching rows are found
+        # seed: makes the sample reproducible (TABLESAMPLE ... REPEATABLE plus a seeded row order)
+        if sample_method == "exact" or self.engine.dialect.name != "postgresql":
+            random_sample: List[tableDomainObj] = self._random_sample_query(tableDomainObj, sample_size, conditions, seed).all()
+            return random_sample
+        while True:
+            random_sample: List[tableDomainObj] = self._random_sample_query(
+                tableDomainObj, sample_size, conditions, seed, sample_method, sample_percent
+            ).all()
+            if len(random_sample) >= sample_size or sample_percent >= 100:
+                return random_sample
+            sample_percent = self._grow_sample_percent(sample_percent, sample_size, len(random_sample))
 
-    
+
+    @reader_method
     def commit_session(self):
+        # result cache entries for the tables written in this transaction are invalidated by _track_written_tables
         self.session.commit()
-        return
\ No newline at end of file
+        return
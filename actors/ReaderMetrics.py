@@ -0,0 +1,377 @@
+# per reader method statistics gathered from engine events
+import bisect
+import functools
+import logging
+import time
+import inspect
+import threading
+import contextvars
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.interfaces import CacheStats
+from sqlalchemy.orm import Session
+from sqlalchemy_example.actors.KeysetCursor import Page
+
+# name of the outermost reader method on the current call stack, statements executed while it is set are attributed to it
+current_reader_method: contextvars.ContextVar = contextvars.ContextVar("current_reader_method", default=None)
+UNTRACKED_METHOD = "<untracked>"
+
+
+def _tag_stream(method_name: str, records: Iterator) -> Iterator:
+    # streamed results execute after the method returned, so re-enter the method tag around every fetch
+    records = iter(records)
+    while True:
+        token = current_reader_method.set(method_name)
+        try:
+            record = next(records)
+        except StopIteration:
+            return
+        finally:
+            current_reader_method.reset(token)
+        yield record
+
+
+async def _tag_async_stream(method_name: str, records: AsyncIterator) -> AsyncIterator:
+    records = records.__aiter__()
+    while True:
+        token = current_reader_method.set(method_name)
+        try:
+            record = await records.__anext__()
+        except StopAsyncIteration:
+            return
+        finally:
+            current_reader_method.reset(token)
+        yield record
+
+
+def reader_method(fn):
+    # decorator tagging every statement executed inside fn with "<Class>.<method>", works for sync and async methods.
+    # while instrumentation is enabled the outermost call is also timed, otherwise that costs one attribute check
+    method_name = fn.__qualname__
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(self, *args, **kwargs):
+            if current_reader_method.get() is not None:
+                return await fn(self, *args, **kwargs)
+            token = current_reader_method.set(method_name)
+            call = instrumentation.start_call(method_name) if instrumentation.enabled else None
+            try:
+                result = await fn(self, *args, **kwargs)
+            except Exception:
+                if call is not None:
+                    instrumentation.finish_call(call, None, error=True)
+                raise
+            finally:
+                current_reader_method.reset(token)
+            if call is not None:
+                instrumentation.finish_call(call, result)
+            if isinstance(result, AsyncIterator):
+                return _tag_async_stream(method_name, result)
+            return result
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        if current_reader_method.get() is not None: # nested reader calls count toward the outer method
+            return fn(self, *args, **kwargs)
+        token = current_reader_method.set(method_name)
+        call = instrumentation.start_call(method_name) if instrumentation.enabled else None
+        try:
+            result = fn(self, *args, **kwargs)
+        except Exception:
+            if call is not None:
+                instrumentation.finish_call(call, None, error=True)
+            raise
+        finally:
+            current_reader_method.reset(token)
+        if call is not None:
+            instrumentation.finish_call(call, result)
+        if isinstance(result, Iterator):
+            return _tag_stream(method_name, result)
+        return result
+    return wrapper
+
+
+class CompiledCacheStats(object):
+    # counts compiled cache outcomes (cache_hit, cache_miss, caching_disabled, no_cache_key, ...) per reader method
+    _lock = threading.Lock()
+    _by_engine: Dict[int, "CompiledCacheStats"] = {}
+
+    def __init__(self):
+        self.counts: Dict[str, Dict[str, int]] = {}
+
+    @classmethod
+    def for_engine(cls, engine: Engine) -> "CompiledCacheStats":
+        # one collector per engine, the event listener is only attached the first time
+        with cls._lock:
+            stats = cls._by_engine.get(id(engine))
+            if stats is None:
+                stats = cls()
+                event.listen(engine, "after_cursor_execute", stats._after_cursor_execute)
+                cls._by_engine[id(engine)] = stats
+            return stats
+
+    @classmethod
+    def get(cls, engine: Engine) -> "CompiledCacheStats":
+        return cls._by_engine.get(id(engine))
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        method_name = current_reader_method.get() or UNTRACKED_METHOD
+        outcome = getattr(context, "cache_hit", CacheStats.NO_CACHE_KEY).name.lower()
+        with self._lock:
+            method_counts = self.counts.setdefault(method_name, {})
+            method_counts[outcome] = method_counts.get(outcome, 0) + 1
+
+    def snapshot(self) -> Dict[str, Dict]:
+        # copy of the counters with a hit_rate over the statements that were eligible for caching
+        with self._lock:
+            snapshot = {method_name: dict(method_counts) for method_name, method_counts in self.counts.items()}
+        for method_counts in snapshot.values():
+            cacheable = method_counts.get("cache_hit", 0) + method_counts.get("cache_miss", 0)
+            method_counts["hit_rate"] = method_counts.get("cache_hit", 0) / cacheable if cacheable > 0 else None
+        return snapshot
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+        return
+
+
+def redact_parameters(parameters: Any) -> Any:
+    # keeps the shape of statement parameters (names, types, list lengths) but never their values
+    if isinstance(parameters, dict):
+        return {name: redact_parameters(value) for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if len(parameters) > 0 and isinstance(parameters[0], (dict, list, tuple)): # executemany parameter sets
+            return [redact_parameters(parameters[0]), f"<{len(parameters)} parameter sets>"]
+        return f"<{type(parameters).__name__} len={len(parameters)}>"
+    return f"<{type(parameters).__name__}>"
+
+
+class LatencyHistogram(object):
+    # fixed millisecond buckets, percentiles are reported as the upper bound of the bucket they fall in
+    buckets_ms = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+    def __init__(self):
+        self.counts: List[int] = [0] * (len(self.buckets_ms) + 1)
+        self.count: int = 0
+        self.total_ms: float = 0.0
+        self.max_ms: float = 0.0
+
+    def observe(self, elapsed_ms: float):
+        self.counts[bisect.bisect_left(self.buckets_ms, elapsed_ms)] += 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def percentile(self, fraction: float) -> float:
+        if self.count == 0:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bucket_ms, bucket_count in zip(self.buckets_ms + (self.max_ms,), self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(bucket_ms, self.max_ms)
+        return self.max_ms
+
+    def snapshot(self) -> Dict:
+        return {
+            "count": self.count,
+            "mean_ms": self.total_ms / self.count if self.count > 0 else None,
+            "p50_ms": self.percentile(0.50),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": self.max_ms,
+            "buckets_ms": dict(zip([str(bucket) for bucket in self.buckets_ms] + ["inf"], self.counts)),
+        }
+
+
+class _ReaderCall(object):
+    # one in-flight outermost reader method call, statements executed inside it add their db time here
+    __slots__ = ("method_name", "start", "checkout_wait_ms", "db_ms", "statements")
+
+    def __init__(self, method_name: str):
+        self.method_name = method_name
+        self.start = time.perf_counter()
+        self.checkout_wait_ms = 0.0
+        self.db_ms = 0.0
+        self.statements = 0
+
+
+class QueryInstrumentation(object):
+    # per reader method and per statement latency, db time, row counts and pool checkout wait, a slow query log
+    # and exporter hooks. engine and session listeners are only attached while enabled.
+    # checkout wait is the time from a session statement being requested to the pool handing out the connection it
+    # runs on, statements on a session that already holds a connection wait for nothing
+    slow_query_logger = logging.getLogger("sqlalchemy_example.slow_query")
+
+    def __init__(self):
+        self.enabled: bool = False
+        self.slow_query_ms: float = 500.0
+        self.exporters: List[Callable[[Dict], None]] = []
+        self._lock = threading.Lock()
+        self._engines: Dict[int, Engine] = {}
+        self._current_call: contextvars.ContextVar = contextvars.ContextVar("current_reader_call", default=None)
+        self._checkout_requested: contextvars.ContextVar = contextvars.ContextVar("checkout_requested", default=None)
+        self.method_stats: Dict[str, Dict] = {}
+        self.statement_stats: Dict[str, Dict] = {}
+
+    def enable(self, engine: Engine, slow_query_ms: float = None, exporter: Callable[[Dict], None] = None):
+        # exporter: called with one dict per finished reader call ("kind": "method") and per statement ("kind": "statement")
+        with self._lock:
+            if len(self._engines) == 0:
+                event.listen(Session, "do_orm_execute", self._do_orm_execute)
+            if id(engine) not in self._engines:
+                event.listen(engine, "checkout", self._checkout)
+                event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+                event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+                event.listen(engine, "handle_error", self._handle_error)
+                self._engines[id(engine)] = engine
+            if slow_query_ms is not None:
+                self.slow_query_ms = slow_query_ms
+            if exporter is not None and exporter not in self.exporters:
+                self.exporters.append(exporter)
+            self.enabled = True
+        return
+
+    def disable(self):
+        # detaches every listener, reader methods go back to a single flag check
+        with self._lock:
+            if len(self._engines) > 0:
+                event.remove(Session, "do_orm_execute", self._do_orm_execute)
+            for engine in self._engines.values():
+                event.remove(engine, "checkout", self._checkout)
+                event.remove(engine, "before_cursor_execute", self._before_cursor_execute)
+                event.remove(engine, "after_cursor_execute", self._after_cursor_execute)
+                event.remove(engine, "handle_error", self._handle_error)
+            self._engines.clear()
+            self.enabled = False
+        return
+
+    def reset(self):
+        with self._lock:
+            self.method_stats.clear()
+            self.statement_stats.clear()
+        return
+
+    def _export(self, record: Dict):
+        for exporter in self.exporters:
+            try:
+                exporter(record)
+            except Exception: # a failing exporter must never fail the query it reports on
+                self.slow_query_logger.exception("instrumentation exporter %r failed", exporter)
+
+    def start_call(self, method_name: str) -> _ReaderCall:
+        call = _ReaderCall(method_name)
+        self._current_call.set(call)
+        self._checkout_requested.set(None)
+        return call
+
+    def finish_call(self, call: _ReaderCall, result: Any, error: bool = False):
+        self._current_call.set(None)
+        wall_ms = (time.perf_counter() - call.start) * 1000
+        rows = None # streamed results are counted per statement instead, other return values are not rows
+        if isinstance(result, Page):
+            rows = len(result.records)
+        elif isinstance(result, list):
+            rows = len(result)
+        elif isinstance(result, dict) and len(result) > 0: # columnar result
+            rows = len(next(iter(result.values())))
+        with self._lock:
+            stats = self.method_stats.setdefault(call.method_name, {
+                "calls": 0, "errors": 0, "rows": 0, "db_ms": 0.0, "checkout_wait_ms": 0.0, "statements": 0,
+                "wall": LatencyHistogram(),
+            })
+            stats["calls"] += 1
+            stats["errors"] += int(error)
+            stats["rows"] += rows or 0
+            stats["db_ms"] += call.db_ms
+            stats["checkout_wait_ms"] += call.checkout_wait_ms
+            stats["statements"] += call.statements
+            stats["wall"].observe(wall_ms)
+        self._export({
+            "kind": "method",
+            "method": call.method_name,
+            "wall_ms": wall_ms,
+            "db_ms": call.db_ms,
+            "checkout_wait_ms": call.checkout_wait_ms,
+            "statements": call.statements,
+            "rows": rows,
+            "error": error,
+        })
+
+    def _do_orm_execute(self, orm_execute_state):
+        # a session statement is about to get its connection, from the pool unless the session already holds one
+        if self._current_call.get() is not None:
+            self._checkout_requested.set(time.perf_counter())
+
+    def _checkout(self, dbapi_connection, connection_record, connection_proxy):
+        requested = self._checkout_requested.get()
+        call = self._current_call.get()
+        if requested is not None and call is not None:
+            call.checkout_wait_ms += (time.perf_counter() - requested) * 1000
+            self._checkout_requested.set(None)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self._checkout_requested.set(None)
+        conn.info.setdefault("reader_query_start", []).append(time.perf_counter())
+
+    def _handle_error(self, exception_context):
+        # a failed statement never reaches after_cursor_execute, drop its start time
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("reader_query_start"):
+            conn.info["reader_query_start"].pop()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("reader_query_start")
+        if not starts:
+            return
+        elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+        method_name = current_reader_method.get() or UNTRACKED_METHOD
+        rows = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None
+        call = self._current_call.get()
+        if call is not None:
+            call.db_ms += elapsed_ms
+            call.statements += 1
+        with self._lock:
+            stats = self.statement_stats.setdefault(statement, {
+                "methods": set(), "calls": 0, "rows": 0, "db": LatencyHistogram(),
+            })
+            stats["methods"].add(method_name)
+            stats["calls"] += 1
+            stats["rows"] += rows or 0
+            stats["db"].observe(elapsed_ms)
+        if elapsed_ms >= self.slow_query_ms:
+            self.slow_query_logger.warning(
+                "slow query %.1f ms in %s: %s | parameters: %s",
+                elapsed_ms, method_name, statement, redact_parameters(parameters)
+            )
+        if len(self.exporters) > 0:
+            self._export({
+                "kind": "statement",
+                "method": method_name,
+                "statement": statement,
+                "parameters": redact_parameters(parameters),
+                "db_ms": elapsed_ms,
+                "rows": rows,
+                "executemany": executemany,
+            })
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            methods = {
+                method_name: dict(stats, wall=stats["wall"].snapshot())
+                for method_name, stats in self.method_stats.items()
+            }
+            statements = {
+                statement: dict(stats, methods=sorted(stats["methods"]), db=stats["db"].snapshot())
+                for statement, stats in self.statement_stats.items()
+            }
+        return {"methods": methods, "statements": statements}
+
+
+# process-wide instance consulted by reader_method
+instrumentation = QueryInstrumentation()
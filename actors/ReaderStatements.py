@@ -0,0 +1,409 @@
+# statement builders and dialect switches shared by the sync and async readers, nothing here executes a statement
+import os
+import sqlalchemy
+from sqlalchemy import update, insert, bindparam, literal, tablesample, tuple_, select, null, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+import heapq
+from itertools import chain, islice
+from typing import Iterable, Iterator, List, Union
+from sqlalchemy import or_, and_
+from sqlalchemy.engine import Engine, URL
+from sqlalchemy.orm import DeclarativeMeta, Query, aliased
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.util import ClauseAdapter
+from sqlalchemy.sql.expression import func
+import configparser
+from sqlalchemy_example.actors.EngineRegistry import EngineRegistry
+from sqlalchemy_example.actors.KeysetCursor import Page, decode_cursor, encode_cursor
+from sqlalchemy_example.actors.ReaderMetrics import CompiledCacheStats, instrumentation
+from sqlalchemy_example.actors.ColumnarResult import build_columnar
+
+class ReaderStatements(object):
+    # mixed into PrimaryReader and AsyncPrimaryReader, which add a session and run these statements on it.
+    # builders that start from a query call construct_query_obj, each reader supplies its own
+    def _read_connection_config(self, echo_state: bool, table_type: str, pool_options: dict):
+        # test/preprod connection values, schema translation and pool settings shared by sync and async readers
+        self.echo_state: bool = echo_state
+        self.config_file: str = os.path.abspath("./config/primary_config.ini")
+        self.config: configparser.RawConfigParser = EngineRegistry.get_config(self.config_file)
+        self.test_mode: int = self.config.getint('TestModeVar','test_mode')
+        self.table_type = table_type
+        self.active_env: str = self.config.get('ActiveEnvVar', 'active_env')
+        self.cloud = 'cloud_name'
+        self.DB_CONN = {
+            True: URL.create(
+                "postgresql",
+                username=self.config.get(f"{self.cloud} TestConnVals", "username"),
+                password=self.config.get(f"{self.cloud} TestConnVals", "password"),
+                host=self.config.get(f"{self.cloud} TestConnVals", "rds"),
+                port=self.config.get(f"{self.cloud} TestConnVals", "port"),
+                database=self.config.get(f"{self.cloud} TestConnVals", "service_name")
+            ),
+            False: URL.create(
+                "postgresql",
+                username=self.config.get(f"{self.cloud} PreProdConnVals", "username"),
+                password=self.config.get(f"{self.cloud} PreProdConnVals", "password"),
+                host=self.config.get(f"{self.cloud} PreProdConnVals", "rds"),
+                port=self.config.get(f"{self.cloud} PreProdConnVals", "port"),
+                database=self.config.get(f"{self.cloud} PreProdConnVals", "service_name")
+            )
+        }[self.test_mode>0]
+        engine_lookup_key = self.test_mode>0
+        if self.cloud == 'test_cloud_name':
+            engine_lookup_key = self.test_mode==0
+        self.schema_translate_map: dict = {
+            True: dict(self.config.items(f'{self.cloud} SchemaTranslateMap')),
+            False: None
+        }[engine_lookup_key]
+        self.pool_options: dict = EngineRegistry.pool_options_from_config(self.config, f"{self.cloud} PoolVals")
+        self.pool_options.update(pool_options or {})
+
+
+    def _event_engine(self) -> Engine:
+        # engine events are only available on the sync engine, async engines wrap one
+        return getattr(self.engine, "sync_engine", self.engine)
+
+
+    def enable_compiled_cache_stats(self) -> CompiledCacheStats:
+        # start counting compiled cache hits/misses per reader method on this reader's (shared) engine
+        return CompiledCacheStats.for_engine(self._event_engine())
+
+
+    def enable_instrumentation(self, slow_query_ms: float=500.0, exporter=None):
+        # time reader methods and statements on this reader's (shared) engine, statements slower than slow_query_ms are
+        # logged to the "sqlalchemy_example.slow_query" logger with redacted parameters.
+        # exporter: optional callable receiving one dict per finished method call and per statement
+        instrumentation.enable(self._event_engine(), slow_query_ms=slow_query_ms, exporter=exporter)
+        return
+
+
+    def disable_instrumentation(self):
+        # instrumentation is process-wide, this detaches it from every engine
+        instrumentation.disable()
+        return
+
+
+    def instrumentation_stats(self) -> dict:
+        # {"methods": {"<Class>.<method>": {calls, errors, rows, db_ms, checkout_wait_ms, statements, wall: histogram}},
+        #  "statements": {sql: {methods, calls, rows, db: histogram}}}
+        return instrumentation.snapshot()
+
+
+    def compiled_cache_stats(self) -> dict:
+        # {"<Class>.<method>": {"cache_hit": n, "cache_miss": n, ..., "hit_rate": float}}, empty until enabled
+        stats = CompiledCacheStats.get(self._event_engine())
+        return stats.snapshot() if stats is not None else {}
+
+
+    def filter_type_switch(self, filter_flag: str):
+        # allows for more dynamically defined query construction
+        return {"and": and_, "or": or_}[filter_flag]
+
+
+    def order_type_swtich(self, order_flag: str, order_attr):
+        return {"max": order_attr.desc(), "min": order_attr.asc()}[order_flag]
+
+
+    def _batch_stream(self, records: Iterable, batch_size: int) -> Iterator[List]:
+        # regroup any row iterator into lists of batch_size rows, the last batch may be shorter
+        records = iter(records)
+        batch = list(islice(records, batch_size))
+        while len(batch) > 0:
+            yield batch
+            batch = list(islice(records, batch_size))
+
+
+    def _order_sort_key(self, order_attr):
+        # python sort key matching postgres ordering, NULLs sort last ascending and first descending
+        def sort_key(record):
+            value = getattr(record, order_attr.key)
+            return (True, 0) if value is None else (False, value)
+        return sort_key
+
+
+    def _merge_order_by(self, order: str, order_attr):
+        # ORDER BY for results merged by _merge_ordered, NULL placement is explicit so every dialect sorts like its sort key
+        return {"max": order_attr.desc().nulls_first(), "min": order_attr.asc().nulls_last()}[order]
+
+
+    def _merge_ordered(self, results: List[Iterable], order: str=None, order_attr=None) -> Iterator:
+        # merge individually ordered result sets (lists or generators) into one ordered stream
+        if order is None:
+            return chain(*results)
+        return heapq.merge(*results, key=self._order_sort_key(order_attr), reverse={"max": True, "min": False}[order])
+
+
+    def _primary_key_attr(self, query: Query):
+        entity = query.column_descriptions[0]["entity"]
+        return getattr(entity, sqlalchemy.inspect(entity).primary_key[0].key)
+
+
+    def _keyset_order_by(self, order: str, order_attr, tie_attr) -> List:
+        # explicit NULL placement, the same on every dialect and matching _order_sort_key
+        order_by = {
+            "min": [order_attr.asc().nulls_last(), tie_attr.asc()],
+            "max": [order_attr.desc().nulls_first(), tie_attr.desc()],
+        }[order]
+        return order_by[1:] if order_attr is tie_attr else order_by
+
+
+    def _keyset_predicate(self, order: str, order_attr, tie_attr, last_value, last_tie, nullable: bool=True):
+        # rows strictly after (last_value, last_tie) in _keyset_order_by order. the row value comparison lets an
+        # index on (order_attr, tie_attr) seek straight to the page start
+        # nullable: False when the query already excludes NULL order_attr values, which drops the NULL branches
+        after_tie = {"min": tie_attr > last_tie, "max": tie_attr < last_tie}[order]
+        if order_attr is tie_attr:
+            return after_tie
+        if last_value is None:
+            # inside the NULL run: NULLs come last ascending, so only they remain; first descending, so everything else follows
+            return {
+                "min": and_(order_attr.is_(None), after_tie),
+                "max": or_(and_(order_attr.is_(None), after_tie), order_attr.is_not(None)),
+            }[order]
+        last_key = tuple_(literal(last_value, order_attr.type), literal(last_tie, tie_attr.type))
+        if nullable is False:
+            return {"min": tuple_(order_attr, tie_attr) > last_key, "max": tuple_(order_attr, tie_attr) < last_key}[order]
+        return {
+            "min": or_(tuple_(order_attr, tie_attr) > last_key, order_attr.is_(None)),
+            "max": tuple_(order_attr, tie_attr) < last_key,
+        }[order]
+
+
+    def _keyset_page_query(self, query: Union[Query, Select], order: str, order_attr, page_size: int, cursor: str) -> tuple:
+        # the query for one page plus one row to tell whether another page follows, with the order and tie attributes
+        tie_attr = self._primary_key_attr(query)
+        order_attr = tie_attr if order_attr is None else order_attr
+        if cursor is not None:
+            last = decode_cursor(cursor, order, order_attr.key, tie_attr.key)
+            query = query.filter(self._keyset_predicate(order, order_attr, tie_attr, last["last_value"], last["last_tie"]))
+        return query.order_by(*self._keyset_order_by(order, order_attr, tie_attr)).limit(page_size + 1), order_attr, tie_attr
+
+
+    def _page_from_records(self, records: List, order: str, order_attr, tie_attr, page_size: int) -> Page:
+        if len(records) <= page_size:
+            return Page(records, None)
+        records = records[:page_size]
+        last_record = records[-1]
+        next_cursor = encode_cursor(
+            order, order_attr.key, tie_attr.key, getattr(last_record, order_attr.key), getattr(last_record, tie_attr.key)
+        )
+        return Page(records, next_cursor)
+
+
+    def _is_entity_query(self, query: Union[Query, Select]) -> bool:
+        # single entity selects return domain objects, anything else returns rows
+        return len(query.column_descriptions) == 1 and isinstance(query.column_descriptions[0]["type"], DeclarativeMeta)
+
+
+    def _range_partitions(self, column, start, end, partitions: int) -> List:
+        # disjoint conditions covering every value of column: partitions even slices of [start, end], the first and
+        # last open ended and NULLs in the last one. start/end can be numbers, dates or datetimes
+        try:
+            step = (end - start) / partitions
+        except TypeError: # e.g. dates passed as strings, nothing to split on
+            return [sqlalchemy.true()]
+        if partitions < 2 or not start < end:
+            return [sqlalchemy.true()]
+        bounds = [start + step * number for number in range(1, partitions)]
+        conditions = [column < bounds[0]]
+        conditions.extend(and_(lower <= column, column < upper) for lower, upper in zip(bounds, bounds[1:]))
+        conditions.append(or_(column >= bounds[-1], column.is_(None)))
+        return conditions
+
+
+    def aggregate_type_switch(self, aggregate_flag: str):
+        return {
+            "count": func.count,
+            "count_distinct": lambda column: func.count(column.distinct()),
+            "sum": func.sum,
+            "min": func.min,
+            "max": func.max,
+            "avg": func.avg,
+        }[aggregate_flag]
+
+
+    def _check_aggregate_args(self, group_by: List, aggregates: dict, grouping_sets: List[List]=None):
+        # postgresql rejects a group column that no grouping set names and the UNION ALL fallback would silently return
+        # it as NULL, so both are refused here, as are aggregates the statement cannot be built from
+        for label, aggregate in aggregates.items():
+            if aggregate == "count":
+                continue
+            if not isinstance(aggregate, tuple) or len(aggregate) != 2:
+                raise ValueError(f"aggregate {label!r} must be \"count\" or a (flag, column) tuple, got {aggregate!r}")
+            try:
+                self.aggregate_type_switch(aggregate[0])
+            except KeyError:
+                raise ValueError(f"aggregate {label!r} has unknown flag {aggregate[0]!r}") from None
+        if grouping_sets is None:
+            return
+        group_keys = [column.key for column in group_by]
+        named_keys = set(key for grouping_set in grouping_sets for key in grouping_set)
+        unknown_keys = sorted(named_keys - set(group_keys))
+        if len(unknown_keys) > 0:
+            raise ValueError(f"grouping sets name {unknown_keys}, which are not group_by columns {group_keys}")
+        unused_keys = [key for key in group_keys if key not in named_keys]
+        if len(unused_keys) > 0:
+            raise ValueError(f"group_by columns {unused_keys} are in no grouping set, add them to one or drop them from group_by")
+        return
+
+
+    def _aggregate_statement(self, cond: List, filter_type: str, group_by: List, aggregates: dict, grouping_sets: List[List]=None):
+        # the filtered rows are selected in a subquery first, so a computed group column (e.g. a labelled case()) is
+        # written once and grouping sets can refer to it by name. grouping sets use GROUPING SETS on postgresql and a
+        # UNION ALL of one GROUP BY per set elsewhere, rows carry a "grouping" bitmask as postgresql's grouping() does
+        if grouping_sets is not None:
+            grouping_sets = [[key if isinstance(key, str) else key.key for key in grouping_set] for grouping_set in grouping_sets]
+        self._check_aggregate_args(group_by, aggregates, grouping_sets)
+        filter_obj = self.filter_type_switch(filter_type) # can only be "and" or "or"
+        input_columns = {column.key: column for column in group_by}
+        for aggregate in aggregates.values():
+            if aggregate != "count":
+                input_columns[aggregate[1].key] = aggregate[1]
+        # a bare count() with no group columns needs no input column, a constant keeps the subquery valid
+        filtered_columns = [column.label(key) for key, column in input_columns.items()] or [literal(1).label("matched")]
+        filtered = select(*filtered_columns).where(filter_obj(*cond)).subquery("filtered")
+        group_columns = [filtered.c[column.key] for column in group_by]
+        aggregate_columns = [
+            (func.count() if aggregate == "count" else self.aggregate_type_switch(aggregate[0])(filtered.c[aggregate[1].key])).label(label)
+            for label, aggregate in aggregates.items()
+        ]
+        # select_from(filtered) throughout, with no group columns and only count() nothing else names the subquery
+        if grouping_sets is None:
+            return select(*group_columns, *aggregate_columns).select_from(filtered).group_by(*group_columns)
+        if self.engine.dialect.name == "postgresql":
+            return select(
+                *group_columns, *aggregate_columns, func.grouping(*group_columns).label("grouping")
+            ).select_from(filtered).group_by(
+                func.grouping_sets(*[tuple_(*[filtered.c[key] for key in grouping_set]) for grouping_set in grouping_sets])
+            )
+        set_statements = []
+        for grouping_set in grouping_sets:
+            grouping_mask = sum(1 << (len(group_columns) - 1 - number) for number, column in enumerate(group_columns) if column.key not in grouping_set)
+            set_statements.append(
+                select(
+                    *[column if column.key in grouping_set else null().label(column.key) for column in group_columns],
+                    *aggregate_columns,
+                    literal(grouping_mask).label("grouping")
+                ).select_from(filtered).group_by(*[filtered.c[key] for key in grouping_set])
+            )
+        return union_all(*set_statements)
+
+
+    def _aggregate_result(self, statement, result: List, result_format: str) -> Union[List, dict]:
+        if result_format != "orm":
+            return build_columnar(
+                result_format,
+                [result],
+                [column.key for column in statement.selected_columns],
+                [column.type for column in statement.selected_columns]
+            )
+        return result
+
+
+    def _rows_as_mappings(self, tableDomainObj: DeclarativeMeta, rows: List) -> List[dict]:
+        # accept plain mappings or domain objects, domain objects only contribute the attributes that were set on them
+        column_keys = [column_attr.key for column_attr in sqlalchemy.inspect(tableDomainObj).column_attrs]
+        mappings = []
+        for row in rows:
+            if isinstance(row, tableDomainObj):
+                mappings.append({key: getattr(row, key) for key in column_keys if key in row.__dict__})
+            else:
+                mappings.append(dict(row))
+        return mappings
+
+
+    def _group_by_keys(self, mappings: List[dict]) -> List[List[dict]]:
+        # executemany and multi-row VALUES need every row in a statement to carry the same columns
+        groups = {}
+        for mapping in mappings:
+            groups.setdefault(tuple(sorted(mapping)), []).append(mapping)
+        return list(groups.values())
+
+
+    def _affected_rows(self, result, batch: List) -> int:
+        # some drivers cannot report rowcount for executemany, fall back to the number of rows sent
+        return result.rowcount if result.rowcount >= 0 else len(batch)
+
+
+    def _insert_statement(self, tableDomainObj: DeclarativeMeta, group: List[dict], index_elements: List[str]=None) -> tuple:
+        return insert(tableDomainObj.__table__), group
+
+
+    def _update_statement(self, tableDomainObj: DeclarativeMeta, group: List[dict], index_elements: List[str]=None) -> tuple:
+        # primary key values move to pk_ bind names, the remaining keys become the SET clause
+        table = tableDomainObj.__table__
+        pk_names = [column.name for column in table.primary_key.columns]
+        pk_statement = and_(*[table.c[name] == bindparam(f"pk_{name}") for name in pk_names])
+        params = [
+            {(f"pk_{key}" if key in pk_names else key): value for key, value in mapping.items()}
+            for mapping in group
+        ]
+        return update(table).where(pk_statement), params
+
+
+    def _upsert_statement(self, tableDomainObj: DeclarativeMeta, group: List[dict], index_elements: List[str]=None) -> tuple:
+        table = tableDomainObj.__table__
+        if index_elements is None:
+            index_elements = [column.name for column in table.primary_key.columns]
+        statement = self.upsert_type_switch(self.engine.dialect.name)(table).values(group)
+        update_columns = {key: statement.excluded[key] for key in group[0] if key not in index_elements}
+        if len(update_columns) > 0:
+            statement = statement.on_conflict_do_update(index_elements=index_elements, set_=update_columns)
+        else:
+            statement = statement.on_conflict_do_nothing(index_elements=index_elements)
+        return statement, None
+
+
+    def _bulk_batches(self, statement_builder, tableDomainObj: DeclarativeMeta, rows: List, batch_size: int, index_elements: List[str]=None) -> Iterator[List[tuple]]:
+        # yields one list of (statement, params, group) per batch, each batch is committed as a unit by the caller
+        mappings = self._rows_as_mappings(tableDomainObj, rows)
+        for start in range(0, len(mappings), batch_size):
+            batch = mappings[start:start + batch_size]
+            yield [
+                statement_builder(tableDomainObj, group, index_elements) + (group,)
+                for group in self._group_by_keys(batch)
+            ]
+
+
+    def upsert_type_switch(self, dialect_name: str):
+        # ON CONFLICT is dialect specific syntax
+        return {"postgresql": postgresql.insert, "sqlite": sqlite.insert}[dialect_name]
+
+
+    def tablesample_type_switch(self, sample_method: str):
+        # SYSTEM samples whole pages (fast, clustered), BERNOULLI samples individual rows (slower, uniform)
+        return {"system": func.system, "bernoulli": func.bernoulli}[sample_method]
+
+
+    def _random_order(self, tableDomainObj, seed: float=None):
+        # random() unless seeded, a seeded order hashes the primary key with the seed so it repeats across runs
+        if seed is None:
+            return func.random()
+        pk_column = getattr(tableDomainObj, sqlalchemy.inspect(tableDomainObj).mapper.primary_key[0].key)
+        return func.md5(func.concat(pk_column, str(seed)))
+
+
+    def _random_sample_query(self, tableDomainObj: DeclarativeMeta, sample_size: int, conditions: List, seed: float=None,
+                             sample_method: str="exact", sample_percent: float=100.0):
+        if sample_method == "exact":
+            sample_entity = tableDomainObj
+        else:
+            sampled_table = tablesample(
+                tableDomainObj.__table__,
+                self.tablesample_type_switch(sample_method)(sample_percent),
+                name="sampled_table",
+                seed=None if seed is None else literal(seed)
+            )
+            sample_entity = aliased(tableDomainObj, sampled_table)
+            # conditions are written against the table, point their columns at the sampled alias
+            conditions = [ClauseAdapter(sampled_table).traverse(condition) for condition in conditions]
+        query = self.construct_query_obj([sample_entity])
+        if len(conditions) > 0:
+            query = query.filter(and_(*conditions))
+        return query.order_by(self._random_order(sample_entity, seed)).limit(sample_size)
+
+
+    def _grow_sample_percent(self, sample_percent: float, sample_size: int, found: int) -> float:
+        # at least double, or jump to the percentage the observed match rate suggests
+        expected_percent = sample_percent * sample_size / max(found, 1) * 1.5
+        return min(100.0, max(sample_percent * 2, expected_percent))
@@ -0,0 +1,101 @@
+# bounded, time limited cache of materialized query results shared by reader objects
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Tuple
+import sqlalchemy
+from sqlalchemy.engine import Engine, Row
+from sqlalchemy.schema import Table
+from sqlalchemy.sql.util import find_tables
+
+
+class ResultCache(object):
+    # LRU ordered entries of key -> (expires_at, table names, result), evicted past maxsize or after ttl seconds
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize: int = maxsize
+        self.ttl: float = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.invalidations: int = 0
+
+    @staticmethod
+    def _freeze(value: Any) -> Any:
+        # expanding IN and ARRAY parameters arrive as lists, keys need hashable values
+        if isinstance(value, (list, tuple, set)):
+            return tuple(ResultCache._freeze(item) for item in value)
+        return value
+
+    def make_key(self, statement, engine: Engine) -> Tuple:
+        # the statement's structural cache key (the one the compiled cache uses, nothing is compiled here) plus its
+        # parameter values, the engine keeps schema translated targets apart. None when the statement is not cacheable
+        cache_key = statement._generate_cache_key()
+        if cache_key is None:
+            return None
+        params = tuple(self._freeze(bind.effective_value) for bind in cache_key.bindparams)
+        return id(engine), cache_key.key, params
+
+    @staticmethod
+    def table_names(statement) -> frozenset:
+        # find_tables also walks into subqueries and yields them (and None for unbound columns), only tables are kept
+        return frozenset(
+            table.fullname for table in find_tables(statement, check_columns=True, include_crud=True) if isinstance(table, Table)
+        )
+
+    @staticmethod
+    def is_cacheable(result: List) -> bool:
+        # ORM instances stay attached to the session that loaded them, only plain values and Row tuples
+        # (which hold no connection once fetched) are cached
+        return not any(
+            sqlalchemy.inspect(record, raiseerr=False) is not None
+            for row in result
+            for record in (row if isinstance(row, (tuple, Row)) else (row,))
+        )
+
+    def get(self, key: Tuple) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key] # expired
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, list(entry[2]) # callers get their own list so they cannot mutate the cached one
+
+    def put(self, key: Tuple, tables: frozenset, result: List):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, tables, list(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return
+
+    def invalidate(self, tables: Iterable[str]):
+        # drop every entry that read from one of the written tables
+        tables = set(tables)
+        with self._lock:
+            stale_keys = [key for key, entry in self._entries.items() if entry[1] & tables]
+            for key in stale_keys:
+                del self._entries[key]
+            self.invalidations += len(stale_keys)
+        return
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        return
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "size": len(self._entries),
+            }
@@ -0,0 +1,197 @@
+# throwaway databases holding a synthetic reports.inventory table for reader benchmarks
+import hashlib
+import os
+import re
+import shutil
+import socket
+import subprocess
+import tempfile
+from typing import List, Union
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, URL
+from sqlalchemy.schema import CreateTable
+from sqlalchemy_example.actors.EngineRegistry import EngineRegistry
+from sqlalchemy_example.actors.IndexManager import IndexManager
+from sqlalchemy_example.domain.reports.Inventory import Inv
+from sqlalchemy_example.benchmarks.InventoryGenerator import InventoryGenerator
+
+# readers resolve their engine from ./config/primary_config.ini, the benchmark writes one pointing at this target
+# and registers the benchmark engine under it
+BENCHMARK_CONFIG = """[TestModeVar]
+test_mode = 1
+
+[ActiveEnvVar]
+active_env = benchmark
+
+[cloud_name TestConnVals]
+username = benchmark
+password = benchmark
+rds = benchmark
+port = 5432
+service_name = benchmark
+
+[cloud_name PreProdConnVals]
+username = benchmark
+password = benchmark
+rds = benchmark
+port = 5432
+service_name = benchmark
+
+[cloud_name SchemaTranslateMap]
+reports = reports
+"""
+
+
+class BenchmarkDatabase(object):
+    # subclasses provide the engine, install() makes every reader created afterwards use it
+    backend: str = None
+
+    def __init__(self):
+        self.workdir: str = tempfile.mkdtemp(prefix=f"inventory_bench_{self.backend}_")
+        self.engine: Engine = None
+        self._previous_cwd: str = None
+
+    def create_schema(self):
+        # indexes are built after loading, which is much faster than maintaining them row by row
+        Inv.__table__.drop(self.engine, checkfirst=True)
+        with self.engine.begin() as conn:
+            conn.execute(CreateTable(Inv.__table__))
+
+    def create_indexes(self) -> List[str]:
+        created = IndexManager.create_indexes(self.engine, Inv)
+        self.analyze()
+        return created
+
+    def load(self, generator: InventoryGenerator, batch_size: int = 10000) -> int:
+        loaded = 0
+        with self.engine.begin() as conn:
+            for batch in generator.iter_batches(batch_size):
+                conn.execute(Inv.__table__.insert(), batch)
+                loaded += len(batch)
+        self.analyze()
+        return loaded
+
+    def analyze(self):
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+
+    def install(self):
+        # readers read ./config relative to the working directory, so the benchmark runs from its own workdir
+        os.makedirs(os.path.join(self.workdir, "config"), exist_ok=True)
+        with open(os.path.join(self.workdir, "config", "primary_config.ini"), "w") as config_file:
+            config_file.write(BENCHMARK_CONFIG)
+        self._previous_cwd = os.getcwd()
+        os.chdir(self.workdir)
+        target = URL.create("postgresql", username="benchmark", password="benchmark", host="benchmark", port=5432, database="benchmark")
+        EngineRegistry.register_engine(target, self.engine, schema_translate_map={"reports": "reports"})
+        return
+
+    def close(self):
+        if self._previous_cwd is not None:
+            os.chdir(self._previous_cwd)
+        EngineRegistry.dispose_all()
+        if self.engine is not None:
+            self.engine.dispose()
+        self._remove_workdir()
+        return
+
+    def _remove_workdir(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class SQLiteBenchmarkDatabase(BenchmarkDatabase):
+    # file backed so 10M rows do not need to fit in memory, reports is attached as its own database file
+    backend = "sqlite"
+
+    def __init__(self):
+        super(SQLiteBenchmarkDatabase, self).__init__()
+        reports_file = os.path.join(self.workdir, "reports.db")
+        self.engine = sqlalchemy.create_engine(f"sqlite:///{os.path.join(self.workdir, 'main.db')}")
+
+        @event.listens_for(self.engine, "connect")
+        def _prepare_connection(dbapi_connection, connection_record):
+            dbapi_connection.execute(f"ATTACH DATABASE '{reports_file}' AS reports")
+            # sqlite has no REGEXP implementation of its own, regexp_match() compiles to it. md5 and concat
+            # stand in for the postgresql functions seeded random_sample orders by
+            dbapi_connection.create_function(
+                "regexp", 2, lambda pattern, value: value is not None and re.search(pattern, value) is not None, deterministic=True
+            )
+            dbapi_connection.create_function(
+                "md5", 1, lambda value: None if value is None else hashlib.md5(str(value).encode()).hexdigest(), deterministic=True
+            )
+            dbapi_connection.create_function(
+                "concat", -1, lambda *values: "".join(str(value) for value in values if value is not None), deterministic=True
+            )
+
+    def analyze(self):
+        # sqlite connections read the statistics when they load the schema, pooled connections opened before ANALYZE
+        # would keep planning without them, so they are closed and every later statement plans with the same statistics
+        super(SQLiteBenchmarkDatabase, self).analyze()
+        self.engine.dispose()
+
+
+class PostgresBenchmarkDatabase(BenchmarkDatabase):
+    # uses url when given, otherwise starts a private cluster with initdb/pg_ctl from pg_bin or PATH
+    backend = "postgresql"
+
+    def __init__(self, url: Union[str, URL] = None, pg_bin: str = None):
+        super(PostgresBenchmarkDatabase, self).__init__()
+        self.pg_bin: str = pg_bin
+        self.data_dir: str = None
+        if url is None:
+            url = self._start_cluster()
+        self.engine = sqlalchemy.create_engine(url)
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql("CREATE SCHEMA IF NOT EXISTS reports")
+
+    def _binary(self, name: str) -> str:
+        binary = os.path.join(self.pg_bin, name) if self.pg_bin else shutil.which(name)
+        if binary is None or not os.path.exists(binary):
+            raise RuntimeError(f"'{name}' not found, pass pg_bin or a postgres url")
+        return binary
+
+    @staticmethod
+    def _free_port() -> int:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+
+    def _start_cluster(self) -> URL:
+        self.data_dir = os.path.join(self.workdir, "pgdata")
+        port = self._free_port()
+        subprocess.run(
+            [self._binary("initdb"), "-D", self.data_dir, "-U", "benchmark", "--auth=trust", "--no-sync"],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        subprocess.run(
+            [self._binary("pg_ctl"), "-D", self.data_dir, "-l", os.path.join(self.workdir, "postgres.log"), "-w",
+             "-o", f"-p {port} -k {self.workdir} -c listen_addresses=127.0.0.1 -c fsync=off", "start"],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        return URL.create("postgresql+psycopg", username="benchmark", host="127.0.0.1", port=port, database="postgres")
+
+    def load(self, generator: InventoryGenerator, batch_size: int = 10000) -> int:
+        # COPY is an order of magnitude faster than INSERT at the 1M/10M row sizes
+        if self.engine.dialect.driver != "psycopg": # only psycopg 3 has row-wise COPY, fall back to inserts
+            return super(PostgresBenchmarkDatabase, self).load(generator, batch_size)
+        columns = [column.name for column in Inv.__table__.columns]
+        loaded = 0
+        raw_connection = self.engine.raw_connection()
+        try:
+            cursor = raw_connection.cursor()
+            with cursor.copy(f"COPY reports.inventory ({', '.join(columns)}) FROM STDIN") as copy:
+                for row in generator.iter_rows():
+                    copy.write_row([row[column] for column in columns])
+                    loaded += 1
+            raw_connection.commit()
+        finally:
+            raw_connection.close()
+        self.analyze()
+        return loaded
+
+    def _remove_workdir(self):
+        # the server has to stop before its data directory goes away
+        if self.data_dir is not None:
+            subprocess.run([self._binary("pg_ctl"), "-D", self.data_dir, "-m", "immediate", "stop"], stdout=subprocess.DEVNULL)
+        shutil.rmtree(self.workdir, ignore_errors=True)
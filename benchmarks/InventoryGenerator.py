@@ -0,0 +1,111 @@
+# deterministic synthetic reports.inventory rows shaped like production data
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List
+
+
+class InventoryGenerator(object):
+    # documents are generated folder by folder so every folder holds several documents, as in production:
+    # K folders (K + 6 digits), P folders (P + 6-9 digits) with /S### supplements and other submission types.
+    # the same seed and row count always produce the same rows
+    start_date: datetime = datetime(2018, 1, 1)
+    days_covered: int = 8 * 365
+    folder_type_weights = {"K": 0.55, "P": 0.25, "DEN": 0.08, "N": 0.07, "H": 0.05}
+    download_status_weights = {"Downloaded": 0.88, "Pending": 0.07, "Failed": 0.05}
+    validation_status_weights = {"Validated": 0.85, "Invalid": 0.06, "Pending": 0.09}
+    extension_weights = {".pdf": 0.82, ".doc": 0.08, ".docx": 0.04, ".xml": 0.03, ".txt": 0.03}
+    sub_types = ["ORIGINAL", "SUPPLEMENT", "AMENDMENT", "CORRESPONDENCE", "RESPONSE", "REPORT"]
+
+    def __init__(self, rows: int, seed: int = 1234, mean_docs_per_folder: int = 8):
+        self.rows: int = rows
+        self.seed: int = seed
+        self.mean_docs_per_folder: int = mean_docs_per_folder
+
+    @staticmethod
+    def _weighted(rng: random.Random, weights: Dict[str, float]) -> str:
+        return rng.choices(list(weights.keys()), weights=list(weights.values()))[0]
+
+    def _folder_id(self, rng: random.Random, folder_type: str, folder_number: int) -> str:
+        # folder_number counts folders of folder_type only, so ids are unique within a type and the type prefix keeps
+        # them apart across types. numbers past the format width just get longer, they never wrap
+        return {
+            "K": lambda: "K%06d" % folder_number,
+            "P": lambda: "P%s" % str(folder_number).zfill(rng.choice([6, 7, 8, 9])),
+            "DEN": lambda: "DEN%06d" % folder_number,
+            "N": lambda: "N%05d" % folder_number,
+            "H": lambda: "H%06d" % folder_number,
+        }[folder_type]()
+
+    def _uniquekey(self, rng: random.Random, folder_type: str, supplement_number: int) -> str:
+        draw = rng.random()
+        if folder_type == "K":
+            if draw < 0.45:
+                return None
+            if draw < 0.70:
+                return "/ORIGINAL"
+            if draw < 0.90:
+                return f"/SUPPLEMENT{supplement_number}"
+            return f"/AMENDMENT{supplement_number}"
+        if folder_type == "P":
+            if draw < 0.35:
+                return None
+            if draw < 0.85:
+                return "/S%03d" % supplement_number
+            if draw < 0.95:
+                return f"/SUPPLEMENT{supplement_number}"
+            return f"/RESPONSE{supplement_number}"
+        return None if draw < 0.6 else "/ORIGINAL"
+
+    def _document(self, rng: random.Random, folder_id: str, folder_type: str, folder_date: datetime, document_number: int) -> Dict:
+        creation_date = folder_date + timedelta(days=rng.randint(0, 120), seconds=rng.randint(0, 86399))
+        download_status = self._weighted(rng, self.download_status_weights)
+        validation_status = self._weighted(rng, self.validation_status_weights)
+        downloaded = download_status == "Downloaded"
+        validated = validation_status == "Validated"
+        updated = rng.random() < 0.3
+        return {
+            "creation_date": creation_date,
+            "modify_date": creation_date + timedelta(days=rng.randint(0, 30)),
+            "object_id": "09%014x%s" % (document_number, self._weighted(rng, self.extension_weights)),
+            "folder_id": folder_id,
+            "folder_type": folder_type,
+            "sub_type": rng.choice(self.sub_types),
+            "object_name": f"{folder_id}_{document_number}",
+            "uniquekey": self._uniquekey(rng, folder_type, rng.randint(1, 40)),
+            "guid": "%032x" % rng.getrandbits(128),
+            "full_content_size": round(rng.lognormvariate(13, 1.2), 1),
+            "number_of_pages": max(1, int(rng.lognormvariate(3, 1))),
+            "doc_download_status": download_status,
+            "doc_validation_status": validation_status,
+            "doc_validation_date": creation_date + timedelta(days=rng.randint(1, 10)) if validated else None,
+            "doc_download_date": creation_date + timedelta(hours=rng.randint(1, 72)) if downloaded else None,
+            "document_date": creation_date - timedelta(days=rng.randint(0, 60)),
+            "scan_date": creation_date + timedelta(hours=rng.randint(1, 48)) if rng.random() < 0.4 else None,
+            "index_date": creation_date + timedelta(days=rng.randint(0, 5)),
+            "load_date": creation_date + timedelta(days=rng.randint(0, 2)),
+            "update_date": creation_date + timedelta(days=rng.randint(1, 400)) if updated else None,
+            "comment_doc_failure": "download failed" if download_status == "Failed" else None,
+        }
+
+    def iter_rows(self) -> Iterator[Dict]:
+        rng = random.Random(self.seed)
+        produced = 0
+        folder_numbers = {folder_type: 0 for folder_type in self.folder_type_weights}
+        while produced < self.rows:
+            folder_type = self._weighted(rng, self.folder_type_weights)
+            folder_numbers[folder_type] += 1
+            folder_id = self._folder_id(rng, folder_type, folder_numbers[folder_type])
+            folder_date = self.start_date + timedelta(days=rng.randint(0, self.days_covered))
+            for _ in range(min(max(1, int(rng.expovariate(1 / self.mean_docs_per_folder))), self.rows - produced)):
+                yield self._document(rng, folder_id, folder_type, folder_date, produced)
+                produced += 1
+
+    def iter_batches(self, batch_size: int = 10000) -> Iterator[List[Dict]]:
+        batch = []
+        for row in self.iter_rows():
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if len(batch) > 0:
+            yield batch
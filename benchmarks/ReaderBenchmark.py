@@ -0,0 +1,264 @@
+# times the public InvInventoryReader methods against a BenchmarkDatabase and stores comparable results
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List
+import sqlalchemy
+from sqlalchemy import select, delete
+from sqlalchemy_example.domain.reports.Inventory import Inv
+from sqlalchemy_example.actors.ChangeFeed import Watermark
+from sqlalchemy_example.actors.DAO.reports.InventoryReader import InvInventoryReader
+from sqlalchemy_example.actors.IndexManager import IndexManager
+from sqlalchemy_example.actors.PlanChecker import PlanChecker
+from sqlalchemy_example.benchmarks.BenchmarkDatabase import BenchmarkDatabase
+
+# call(reader, fixtures) runs the timed work, cleanup(reader, fixtures) runs untimed after every call
+# full_scan: the case reads most of the table by design, so --check-plans accepts a sequential scan for it
+BenchmarkCase = namedtuple("BenchmarkCase", ["name", "call", "cleanup", "full_scan"], defaults=[None, False])
+ROW_SIZES = {"100k": 100000, "1m": 1000000, "10m": 10000000}
+
+
+def _bench_rows(fixtures: Dict, count: int = 100) -> List[Dict]:
+    # fresh documents for the insert benchmark, removed again by _delete_bench_rows
+    template = dict(fixtures["inv_rows"][0])
+    return [dict(template, object_id=f"bench-insert-{number:06d}.pdf") for number in range(count)]
+
+
+def _delete_bench_rows(reader: InvInventoryReader, fixtures: Dict):
+    reader.session.execute(delete(Inv).where(Inv.object_id.startswith("bench-insert-")))
+    reader.session.commit()
+
+
+def _consume(records: Iterable) -> List:
+    return [record for record in records]
+
+
+default_cases: List[BenchmarkCase] = [
+    BenchmarkCase("get_folder_ids", lambda r, fx: r.get_folder_ids([Inv.creation_date >= fx["range"][0]], ["K"])),
+    BenchmarkCase("get_folder_ids[distinct]", lambda r, fx: r.get_folder_ids([Inv.creation_date >= fx["range"][0]], ["K"], distinct=True)),
+    BenchmarkCase("query_creationdate_range", lambda r, fx: r.query_creationdate_range(fx["range"], ["K"])),
+    BenchmarkCase("query_creationdate_range[all]", lambda r, fx: r.query_creationdate_range(fx["range"], ["all"])),
+    BenchmarkCase("query_creationdate_range[stream]", lambda r, fx: _consume(r.query_creationdate_range(fx["range"], ["K"], stream=True))),
+    BenchmarkCase("query_creationdate_range[numpy]", lambda r, fx: r.query_creationdate_range(
+        fx["range"], ["K"], columns=[Inv.object_id, Inv.creation_date, Inv.full_content_size], result_format="numpy"
+    )),
+    BenchmarkCase("query_creationdate_exact", lambda r, fx: r.query_creationdate_exact(fx["exact_date"], ["K"])),
+    BenchmarkCase("query_r_object_id", lambda r, fx: r.query_r_object_id(fx["object_ids"], ["K"])),
+    BenchmarkCase("query_submission_id", lambda r, fx: r.query_submission_id(fx["folder_ids"], ["K"])),
+    BenchmarkCase("query_submission_id[supplements]", lambda r, fx: r.query_submission_id(fx["folder_ids"] + fx["supplement_ids"], ["all"])),
+    BenchmarkCase("query_submission_id[ordered]", lambda r, fx: r.query_submission_id(
+        fx["folder_ids"], ["K"], order="max", order_attr=Inv.creation_date
+    )),
+    BenchmarkCase("query_creationdate_range_page", lambda r, fx: r.query_creationdate_range_page(fx["range"], ["all"]).records),
+    BenchmarkCase("query_submission_id_page", lambda r, fx: r.query_submission_id_page(fx["folder_ids"], ["K"]).records),
+    BenchmarkCase("query_unique_column_values", lambda r, fx: _consume(r.query_unique_column_values([Inv.sub_type], ["K"]))),
+    BenchmarkCase("random_kdoc_sample", lambda r, fx: r.random_kdoc_sample(100, seed=0.5)),
+    BenchmarkCase("random_pma_sample", lambda r, fx: r.random_pma_sample(100, seed=0.5)),
+    BenchmarkCase("random_nonkdoc_sample", lambda r, fx: r.random_nonkdoc_sample(100, seed=0.5)),
+    BenchmarkCase("get_max_r_creation_date_by_subid", lambda r, fx: r.get_max_r_creation_date_by_subid(fx["folder_ids"] + fx["p_folder_ids"])),
+    BenchmarkCase("aggregate_inventory", lambda r, fx: r.aggregate_inventory(
+        ["doctype"], {"documents": "count", "pages": ("sum", Inv.number_of_pages), "folders": ("count_distinct", Inv.folder_id)}
+    ), full_scan=True),
+    BenchmarkCase("aggregate_inventory[grouping_sets]", lambda r, fx: r.aggregate_inventory(
+        ["doctype", Inv.doc_download_status, Inv.doc_validation_status], {"documents": "count"},
+        grouping_sets=[["doctype", "doc_download_status"], ["doctype", "doc_validation_status"], []]
+    ), full_scan=True),
+    BenchmarkCase("get_change_sups", lambda r, fx: r.get_change_sups(fx["p_folder_ids"], since=fx["range"][0])),
+    BenchmarkCase("iter_changes", lambda r, fx: [
+        row for batch in r.iter_changes(["all"], since=Watermark(fx["range"][0], ""), batch_size=1000) for row in batch.rows
+    ]),
+    BenchmarkCase("insert_rows", lambda r, fx: [None] * r.insert_rows(Inv, _bench_rows(fx)), cleanup=_delete_bench_rows),
+    BenchmarkCase("update_rows", lambda r, fx: [None] * r.update_rows(Inv, fx["inv_rows"])),
+    BenchmarkCase("upsert_rows", lambda r, fx: [None] * r.upsert_rows(Inv, fx["inv_rows"])),
+]
+
+
+class ReaderBenchmark(object):
+    # every case is run warmup times untimed, then iterations times for latency, then once under tracemalloc
+    # for peak python memory (tracing slows allocation heavy code, so it is kept out of the latency samples)
+
+    def __init__(self, database: BenchmarkDatabase, rows: int, seed: int, iterations: int = 5, warmup: int = 1):
+        self.database: BenchmarkDatabase = database
+        self.rows: int = rows
+        self.seed: int = seed
+        self.iterations: int = iterations
+        self.warmup: int = warmup
+        self.fixtures: Dict = None
+
+    def build_fixtures(self) -> Dict:
+        # arguments are picked from the loaded data so every lookup hits real folders and documents
+        with self.database.engine.connect() as conn:
+            folder_ids = conn.execute(
+                select(Inv.folder_id).where(Inv.folder_id.startswith("K")).distinct().order_by(Inv.folder_id).limit(500)
+            ).scalars().all()
+            p_folder_ids = conn.execute(
+                select(Inv.folder_id).where(Inv.folder_id.startswith("P")).distinct().order_by(Inv.folder_id).limit(200)
+            ).scalars().all()
+            supplement_ids = conn.execute(
+                select(Inv.folder_id, Inv.uniquekey)
+                .where(Inv.folder_id.startswith("P"), Inv.uniquekey.startswith("/S"), Inv.object_id.endswith(".pdf"))
+                .distinct().order_by(Inv.folder_id, Inv.uniquekey).limit(200)
+            ).all()
+            object_ids = conn.execute(
+                select(Inv.object_id).where(Inv.folder_id.startswith("K")).order_by(Inv.object_id).limit(200)
+            ).scalars().all()
+            median_date = conn.execute(
+                select(Inv.creation_date).order_by(Inv.creation_date).offset(self.rows // 2).limit(1)
+            ).scalar_one()
+            exact_date = conn.execute(
+                select(Inv.creation_date).where(*InvInventoryReader.kfile_conditions_list)
+                .where(Inv.creation_date >= median_date).order_by(Inv.creation_date).limit(1)
+            ).scalar()
+            inv_rows = conn.execute(select(Inv.__table__).order_by(Inv.object_id).limit(100)).mappings().all()
+        self.fixtures = {
+            "folder_ids": folder_ids,
+            "p_folder_ids": p_folder_ids,
+            "supplement_ids": [f"{folder_id}{uniquekey}" for folder_id, uniquekey in supplement_ids],
+            "object_ids": object_ids,
+            "exact_date": exact_date or median_date,
+            "range": [median_date, median_date + timedelta(days=7)],
+            "inv_rows": [dict(row) for row in inv_rows],
+        }
+        return self.fixtures
+
+    @staticmethod
+    def _row_count(result) -> int:
+        if result is None:
+            return 0
+        if isinstance(result, dict): # numpy columns
+            return len(next(iter(result.values()))) if len(result) > 0 else 0
+        if hasattr(result, "num_rows"): # pyarrow.Table
+            return result.num_rows
+        if isinstance(result, tuple): # return_query results
+            return len(result[0])
+        return len(result)
+
+    def _call(self, reader: InvInventoryReader, case: BenchmarkCase):
+        # every call starts from a new session so the identity map does not carry objects between iterations
+        reader.connect()
+        try:
+            return case.call(reader, self.fixtures)
+        finally:
+            if case.cleanup is not None:
+                case.cleanup(reader, self.fixtures)
+            reader.disconnect()
+
+    def run_case(self, reader: InvInventoryReader, case: BenchmarkCase) -> Dict:
+        for _ in range(self.warmup):
+            self._call(reader, case)
+        latencies_ms = []
+        rows = 0
+        for _ in range(self.iterations):
+            gc.collect()
+            start = time.perf_counter()
+            result = self._call(reader, case)
+            latencies_ms.append((time.perf_counter() - start) * 1000)
+            rows = self._row_count(result)
+            del result
+        gc.collect()
+        tracemalloc.start()
+        self._call(reader, case)
+        peak_memory_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        total_seconds = sum(latencies_ms) / 1000
+        percentiles = statistics.quantiles(latencies_ms, n=100, method="inclusive") if len(latencies_ms) > 1 else latencies_ms * 99
+        return {
+            "iterations": self.iterations,
+            "rows": rows,
+            "calls_per_second": self.iterations / total_seconds if total_seconds > 0 else None,
+            "rows_per_second": rows * self.iterations / total_seconds if total_seconds > 0 else None,
+            "mean_ms": statistics.fmean(latencies_ms),
+            "min_ms": min(latencies_ms),
+            "p50_ms": percentiles[49],
+            "p95_ms": percentiles[94],
+            "p99_ms": percentiles[98],
+            "max_ms": max(latencies_ms),
+            "peak_memory_bytes": peak_memory_bytes,
+        }
+
+    def run(self, cases: List[BenchmarkCase] = None, progress: Callable[[str, Dict], None] = None) -> Dict:
+        if self.fixtures is None:
+            self.build_fixtures()
+        reader = InvInventoryReader()
+        results = {}
+        for case in cases or default_cases:
+            results[case.name] = self.run_case(reader, case)
+            if progress is not None:
+                progress(case.name, results[case.name])
+        return {"meta": self.metadata(), "cases": results}
+
+    def check_plans(self, cases: List[BenchmarkCase] = None, disable_seqscan: bool = False) -> List[Dict]:
+        # EXPLAIN every statement the cases execute, see PlanChecker
+        if self.fixtures is None:
+            self.build_fixtures()
+        reader = InvInventoryReader()
+        checker = PlanChecker(reader.engine, disable_seqscan=disable_seqscan)
+        findings = []
+        for case in cases or default_cases:
+            findings.extend(
+                dict(finding, case=case.name, full_scan=case.full_scan) for finding in checker.check(self._call, reader, case)
+            )
+        return findings
+
+    def metadata(self) -> Dict:
+        return {
+            "commit": current_commit(),
+            "backend": self.database.backend,
+            "server_version": ".".join(str(part) for part in self.database.engine.dialect.server_version_info or ()),
+            "rows": self.rows,
+            "seed": self.seed,
+            "indexes": sorted(IndexManager.existing_index_names(self.database.engine, Inv.__table__)),
+            "iterations": self.iterations,
+            "python": platform.python_version(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "machine": platform.platform(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+        }
+
+
+def current_commit() -> str:
+    # commit of the code under test, marked dirty when the working tree has uncommitted changes
+    repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo_dir, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repo_dir, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if dirty else "")
+
+
+def save_results(results: Dict, output_dir: str) -> str:
+    meta = results["meta"]
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"{meta['commit']}_{meta['backend']}_{meta['rows']}_{meta['timestamp'].replace(':', '')}.json")
+    with open(path, "w") as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+    return path
+
+
+def load_results(path: str) -> Dict:
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def compare_results(baseline: Dict, candidate: Dict, metric: str = "p50_ms") -> List[Dict]:
+    # relative change per case, negative is faster for the latency metrics. cases missing from either run are skipped
+    comparison = []
+    for name, baseline_case in baseline["cases"].items():
+        candidate_case = candidate["cases"].get(name)
+        if candidate_case is None or not baseline_case.get(metric):
+            continue
+        comparison.append({
+            "case": name,
+            "baseline": baseline_case[metric],
+            "candidate": candidate_case[metric],
+            "change": (candidate_case[metric] - baseline_case[metric]) / baseline_case[metric],
+        })
+    return comparison
@@ -0,0 +1,94 @@
+# command line entry point for the reader benchmarks
+#   python -m sqlalchemy_example.benchmarks.run_benchmarks --backend sqlite --rows 100k
+#   python -m sqlalchemy_example.benchmarks.run_benchmarks --backend postgresql --rows 1m --pg-bin /usr/lib/postgresql/16/bin
+#   python -m sqlalchemy_example.benchmarks.run_benchmarks --backend postgresql --rows 100k --check-plans --disable-seqscan
+#   python -m sqlalchemy_example.benchmarks.run_benchmarks --compare results/base.json results/candidate.json
+import argparse
+import os
+import sys
+import time
+from sqlalchemy_example.actors.PlanChecker import PlanChecker
+from sqlalchemy_example.benchmarks.BenchmarkDatabase import PostgresBenchmarkDatabase, SQLiteBenchmarkDatabase
+from sqlalchemy_example.benchmarks.InventoryGenerator import InventoryGenerator
+from sqlalchemy_example.benchmarks.ReaderBenchmark import (
+    ROW_SIZES, ReaderBenchmark, compare_results, default_cases, load_results, save_results
+)
+
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def _database(args):
+    return {
+        "sqlite": lambda: SQLiteBenchmarkDatabase(),
+        "postgresql": lambda: PostgresBenchmarkDatabase(url=args.postgres_url, pg_bin=args.pg_bin),
+    }[args.backend]()
+
+
+def _print_case(name: str, result: dict):
+    print(f"  {name:<40} p50 {result['p50_ms']:>10.2f} ms  p95 {result['p95_ms']:>10.2f} ms  "
+          f"{result['rows']:>8} rows  {result['peak_memory_bytes'] / 2**20:>8.1f} MiB peak")
+
+
+def run(args):
+    failed = False
+    cases = [case for case in default_cases if not args.methods or any(method in case.name for method in args.methods)]
+    for size in args.rows:
+        database = _database(args)
+        try:
+            if args.skip_load is False:
+                database.create_schema()
+                start = time.perf_counter()
+                loaded = database.load(InventoryGenerator(ROW_SIZES[size], seed=args.seed))
+                print(f"{database.backend} {size}: loaded {loaded} rows in {time.perf_counter() - start:.1f} s")
+            if args.no_indexes is False:
+                start = time.perf_counter()
+                created = database.create_indexes()
+                print(f"{database.backend} {size}: created {len(created)} indexes in {time.perf_counter() - start:.1f} s")
+            database.install()
+            benchmark = ReaderBenchmark(database, ROW_SIZES[size], args.seed, iterations=args.iterations, warmup=args.warmup)
+            if args.check_plans is True:
+                findings = benchmark.check_plans(cases, disable_seqscan=args.disable_seqscan)
+                print(PlanChecker.format_report(findings))
+                if any(len(finding["sequential_scans"]) > 0 and finding["full_scan"] is False for finding in findings):
+                    failed = True
+                continue
+            results = benchmark.run(cases, progress=_print_case)
+        finally:
+            database.close()
+        print(f"results written to {save_results(results, args.output_dir)}")
+    return 1 if failed else 0
+
+
+def compare(args):
+    baseline, candidate = load_results(args.compare[0]), load_results(args.compare[1])
+    print(f"{baseline['meta']['commit']} -> {candidate['meta']['commit']} ({args.metric})")
+    for row in compare_results(baseline, candidate, args.metric):
+        print(f"  {row['case']:<40} {row['baseline']:>12.2f} {row['candidate']:>12.2f} {row['change']:>+8.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark InvInventoryReader against a synthetic reports.inventory")
+    parser.add_argument("--backend", choices=["sqlite", "postgresql"], default="sqlite")
+    parser.add_argument("--rows", nargs="+", choices=list(ROW_SIZES.keys()), default=["100k"])
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--methods", nargs="*", help="only run cases whose name contains one of these")
+    parser.add_argument("--postgres-url", help="benchmark an existing database instead of starting a private cluster")
+    parser.add_argument("--pg-bin", help="directory holding initdb and pg_ctl, defaults to PATH")
+    parser.add_argument("--skip-load", action="store_true", help="reuse the reports.inventory already in --postgres-url")
+    parser.add_argument("--no-indexes", action="store_true", help="skip creating the indexes Inv declares")
+    parser.add_argument("--check-plans", action="store_true", help="EXPLAIN every case instead of timing it, exit 1 on sequential scans")
+    parser.add_argument("--disable-seqscan", action="store_true", help="plan with enable_seqscan=off, for small postgresql datasets")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), help="compare two saved result files")
+    parser.add_argument("--metric", default="p50_ms")
+    args = parser.parse_args()
+    if args.compare:
+        compare(args)
+        return 0
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,6 @@
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import DeclarativeMeta
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Float, BigInteger
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Float, BigInteger, Index, and_, func
 from typing import Any, Union
 
 Base: Union[DeclarativeMeta, Any] = declarative_base()
@@ -8,7 +8,6 @@ Base: Union[DeclarativeMeta, Any] = declarative_base()
 
 class Inv(Base):
     __tablename__ = 'inventory'
-    __table_args__ = {"schema": "reports"}
 
     creation_date = Column(DateTime(timezone=False))
     modify_date = Column(DateTime(timezone=False))
@@ -32,6 +31,46 @@ class Inv(Base):
     update_date = Column(DateTime(timezone=False))
     comment_doc_failure = Column(String)
 
+    # the partial index predicates repeat the InvInventoryReader doctype conditions they serve, postgresql only uses
+    # a partial index when the query's WHERE contains its predicate. create them with IndexManager.create_indexes,
+    # PlanChecker reports reader statements that still fall back to sequential scans
+    __table_args__ = (
+        # text_pattern_ops lets folder_id LIKE 'K%' use the index whatever the database collation
+        Index("ix_inventory_folder_id_creation_date", folder_id, creation_date, postgresql_ops={"folder_id": "text_pattern_ops"}),
+        Index("ix_inventory_folder_id_uniquekey", folder_id, uniquekey),
+        # object_id breaks creation_date ties, so keyset pages on creation_date seek straight to their first row
+        Index("ix_inventory_creation_date_object_id", creation_date, object_id),
+        Index("ix_inventory_lower_validation_status", func.lower(doc_validation_status)),
+        # change feed order, the expression matches InvInventoryReader.change_timestamp
+        Index("ix_inventory_changed_at_object_id", func.coalesce(update_date, modify_date, creation_date), object_id),
+        Index(
+            "ix_inventory_kfile_creation_date", creation_date, folder_id,
+            postgresql_where=and_(
+                folder_id.startswith("K"),
+                func.lower(doc_download_status)=='downloaded',
+                func.lower(doc_validation_status)=='validated',
+                doc_download_date.isnot(None)
+            )
+        ),
+        Index(
+            "ix_inventory_pdoc_creation_date", creation_date, folder_id,
+            postgresql_where=and_(
+                folder_id.regexp_match('P[0-9]{6,9}'),
+                func.lower(doc_validation_status)=='validated',
+                doc_download_date.isnot(None)
+            )
+        ),
+        Index(
+            "ix_inventory_nonkfile_creation_date", creation_date, folder_id,
+            postgresql_where=and_(
+                folder_id.startswith("K")==False,
+                func.lower(doc_download_status)=='downloaded',
+                func.lower(doc_validation_status)=='validated'
+            )
+        ),
+        {"schema": "reports"}
+    )
+
 
     def __repr__(self):
         return f"""<Inv object_id={self.object_id}